@@ -1,32 +1,100 @@
-from flask import Flask
-import logging
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, g, request
 import os
-from logging.handlers import RotatingFileHandler
+import threading
+import uuid
 from app.routes import init_routes
-from config import SECRET_KEY
+from app import snapshot, metrics, logs, warmup, encoding, conditional, breaker
+from config import SECRET_KEY, SLOW_REQUEST_THRESHOLD_MS, LOG_ACCESS, WARMUP_ENABLED
+
+_import_seconds = time.perf_counter() - _import_started
 
 class Config:
     DEBUG = os.getenv('DEBUG', 'False').lower() in ['true', '1', 't'] 
     SECRET_KEY = SECRET_KEY
 
 def create_app():
+    report = warmup.StartupReport()
+    report.phases["import"] = _import_seconds
+
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = encoding.FastJSONProvider(app)
 
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     log_dir = os.path.join(project_root, 'log')
     os.makedirs(log_dir, exist_ok=True)
     log_path = os.path.join(log_dir, 'app.log')
 
-    # Set up logging
-    handler = RotatingFileHandler(log_path, maxBytes=10000, backupCount=1)
-    handler.setLevel(logging.DEBUG)
-    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
+    # Set up logging: JSON lines written by a background thread
+    with report.phase("logging"):
+        logs.init_logging(app, log_path)
+
+    # Per-request id and timing, exposed on /metrics
+    @app.before_request
+    def start_timer():
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        metrics.start_request(request.url_rule.rule if request.url_rule else None)
+
+    @app.after_request
+    def record_timing(response):
+        response.headers["X-Request-ID"] = g.request_id
+        recorded = metrics.finish_request(request.method, response.status_code)
+        if recorded:
+            endpoint, elapsed, phases, rows = recorded
+            duration_ms = round(elapsed * 1000, 3)
+            fields = {"status": response.status_code, "duration_ms": duration_ms, "remote_addr": request.remote_addr}
+            if duration_ms >= SLOW_REQUEST_THRESHOLD_MS:
+                metrics.SLOW_REQUESTS.inc(endpoint)
+                breakdown = ", ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in phases.items())
+                app.logger.warning(
+                    f"Slow request {request.method} {request.full_path.rstrip('?')} -> {response.status_code} "
+                    f"in {duration_ms:.1f}ms ({breakdown or 'no phases'}; rows={rows})",
+                    extra=fields,
+                )
+            elif LOG_ACCESS:
+                app.logger.info(f"{request.method} {request.path} {response.status_code}", extra=fields)
+        return response
 
-    app.logger.addHandler(handler)
+    # after_request hooks run in reverse order: compress, then ETag/304 on
+    # the final bytes, then record_timing, so timings include both
+    app.after_request(breaker.stale_headers)
+    app.after_request(conditional.conditional_response)
+    app.after_request(encoding.compress_response)
 
-    init_routes(app)
+    with report.phase("routes"):
+        init_routes(app)
+
+    # Open DB connections and load caches before the first request arrives
+    if WARMUP_ENABLED:
+        warmup.warm_up(app, report)
+
+    # Load the org structure snapshot in the background (unless warm-up did) and keep it fresh
+    snapshot.start_refresher(app.logger)
+
+    report.mark_ready()
+    app.extensions["startup_report"] = report
+    app.logger.info(report.summary())
 
     return app
 
-app = create_app()
\ No newline at end of file
+_app = None
+_app_lock = threading.Lock()
+
+def get_app():
+    """The application, created on first use."""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
+
+def __getattr__(name):
+    # WSGI_HANDLER is "app.app": build it when the handler is looked up, so
+    # importing app.* (scripts, the benchmark) doesn't start a whole worker
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
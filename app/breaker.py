@@ -0,0 +1,128 @@
+import threading
+import time
+import pyodbc
+from flask import g, has_request_context
+from app import metrics
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Errors that mean the database can't be reached (or answered too slowly),
+# as opposed to errors in the statement or the data
+UNAVAILABLE_ERRORS = (ConnectionError, pyodbc.OperationalError, pyodbc.InterfaceError)
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of trying a database that has been failing."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"The {name} database is unavailable, not retrying for {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stop calling a database after ``failure_threshold`` failures in a row.
+
+    While open, ``allow()`` raises CircuitOpenError at once instead of
+    letting each request wait for the connection timeout. After
+    ``reset_timeout`` seconds one call is let through as a probe (half
+    open): success closes the breaker, failure opens it for another
+    ``reset_timeout``, anything else frees the slot for the next call.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+
+        # Stats
+        self._opened = 0
+        self._rejected = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def _set_state(self, state):
+        self._state = state
+        metrics.BREAKER_TRANSITIONS.inc(self.name, state)
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call to the database may go ahead now."""
+        if not self.failure_threshold or self._state == CLOSED:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                # One probe at a time; a probe that never reported back is replaced
+                if self._probe_started is None or now - self._probe_started >= self.reset_timeout:
+                    self._probe_started = now
+                    return
+                retry_after = self.reset_timeout - (now - self._probe_started)
+            elif self._state == OPEN:
+                retry_after = self.reset_timeout - (now - self._opened_at)
+            else:
+                return
+            self._rejected += 1
+        metrics.BREAKER_REJECTIONS.inc(self.name)
+        raise CircuitOpenError(self.name, max(retry_after, 1.0))
+
+    def record_success(self):
+        if self._state == CLOSED and not self._failures:
+            return
+        with self._lock:
+            self._failures = 0
+            self._probe_started = None
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def release_probe(self):
+        """The call let through by ``allow()`` ended without telling whether the database works."""
+        if self._state != HALF_OPEN:
+            return
+        with self._lock:
+            self._probe_started = None
+
+    def record_failure(self):
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            self._failures += 1
+            self._probe_started = None
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._opened += 1
+                self._set_state(OPEN)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "opened": self._opened,
+                "rejected": self._rejected,
+            }
+
+
+def mark_stale(age):
+    """Flag the current response as built from data ``age`` seconds old that couldn't be refreshed."""
+    if has_request_context():
+        g.stale_age = max(g.get("stale_age", 0.0), age)
+
+def stale_headers(response):
+    """after_request hook: tell the client the body is stale, if a fallback was used to build it."""
+    age = g.get("stale_age")
+    if age is not None:
+        response.headers["X-Data-Stale-Seconds"] = str(int(age))
+        metrics.STALE_RESPONSES.inc(metrics.endpoint_label())
+    return response
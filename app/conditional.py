@@ -0,0 +1,46 @@
+import hashlib
+from flask import request
+from app import encoding
+from config import CACHE_CONTROL
+
+
+def snapshot_etag(version):
+    """ETag of the current request's response when built from snapshot ``version``.
+
+    Computed from what the response depends on (data version, path,
+    query string, negotiated Content-Encoding) rather than from the body,
+    so a match can be answered before anything is built.
+    """
+    args = sorted(request.args.items(multi=True))
+    key = repr((version, request.path, args, encoding.negotiate()))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def is_fresh(etag):
+    """True if the client already has the representation tagged ``etag``."""
+    return request.if_none_match.contains_weak(etag)
+
+def cache_headers(response, etag):
+    response.set_etag(etag)
+    if CACHE_CONTROL:
+        response.headers["Cache-Control"] = CACHE_CONTROL
+    response.vary.add("Accept-Encoding")
+    return response
+
+def not_modified(response_class, etag):
+    return cache_headers(response_class(status=304), etag)
+
+def conditional_response(response):
+    """after_request hook for GET responses that weren't tagged by the route.
+
+    Tags the final (possibly compressed) body with a hash of its bytes and
+    turns it into a 304 when the client has it. The body was already
+    built, so this only saves the transfer. Streamed responses are left
+    alone.
+    """
+    if (request.method != "GET" or response.status_code != 200
+            or response.is_streamed or "ETag" in response.headers):
+        return response
+    response.add_etag()
+    if CACHE_CONTROL:
+        response.headers["Cache-Control"] = CACHE_CONTROL
+    return response.make_conditional(request)
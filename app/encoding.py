@@ -0,0 +1,146 @@
+import gzip
+import json
+import threading
+import zlib
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from app import metrics
+from config import COMPRESS_MIN_SIZE, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY
+
+try:
+    import orjson
+except ImportError:  # plain json works, just slower
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Encodings offered, most preferred first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson", "text/plain", "text/csv"}
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(value):
+        """Compact JSON with sorted keys, as UTF-8 bytes. Unknown types are written with str()."""
+        return orjson.dumps(value, default=str, option=_ORJSON_OPTIONS)
+else:
+    def dumps_bytes(value):
+        return json.dumps(value, separators=(",", ":"), sort_keys=True, default=str).encode("utf-8")
+
+def dumps(value):
+    return dumps_bytes(value).decode("utf-8")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify / app.json backed by orjson when it is installed.
+
+    Output matches the default provider (sorted keys, compact separators,
+    trailing newline) except that non-ASCII text is written as UTF-8
+    instead of \\u escapes.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get("indent") or orjson is None:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        with metrics.timed("serialize"):
+            body = dumps_bytes(obj) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    # mtime=0 so the same body always compresses to the same bytes
+    return gzip.compress(data, COMPRESS_GZIP_LEVEL, mtime=0)
+
+def negotiate():
+    """The encoding to send the current request's response in, or None."""
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+class Payload:
+    """A response body that is served many times, e.g. built from the org snapshot.
+
+    Compressed variants are made on first request and kept, so repeat
+    requests skip both serialization and compression.
+    """
+
+    def __init__(self, body, mimetype="application/json"):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.mimetype = mimetype
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        data = self._encoded.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._encoded.get(encoding)
+                if data is None:
+                    with metrics.timed("compress"):
+                        data = self._encoded[encoding] = compress(self.body, encoding)
+        return data
+
+    def response(self, response_class):
+        encoding = negotiate() if len(self.body) >= COMPRESS_MIN_SIZE else None
+        response = response_class(self.encoded(encoding) if encoding else self.body, mimetype=self.mimetype)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+def _compress_stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            # Flush every chunk so the client keeps receiving rows as they are fetched
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+def compress_response(response):
+    """after_request hook: compress JSON/text bodies the client accepts compressed."""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        with metrics.timed("compress"):
+            response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,123 @@
+import csv
+import io
+import os
+import zipfile
+from app import snapshot
+from app.singleflight import SingleFlight
+from config import EXPORT_DIR, EXPORT_KEEP
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # CSV only
+    pyarrow = None
+
+ALL_FORMATS = ("parquet", "csv")
+# Formats this worker can write, default first
+FORMATS = ALL_FORMATS if pyarrow is not None else ("csv",)
+
+FILE_PREFIX = "org-export-"
+
+# employees: the HRIS_TrAD columns of the snapshot, as named in the database
+EMPLOYEE_COLUMNS = tuple(snapshot.SQL_COLUMNS)
+# units: one row per unit of the org tree, parents before their children
+UNIT_COLUMNS = ("level", "code", "name", "lokasi", "parent_level", "parent_code", "path")
+
+
+def unit_rows(snap):
+    stack = list(reversed(snap.roots.values()))
+    while stack:
+        unit = stack.pop()
+        parent = unit.parent
+        yield (
+            unit.level, unit.code, unit.name, unit.lokasi,
+            parent.level if parent is not None else None,
+            parent.code if parent is not None else None,
+            "/".join("" if code is None else str(code) for code in snapshot.unit_path(unit)),
+        )
+        stack.extend(reversed(unit.children.values()))
+
+def _columns(rows, count):
+    columns = [[] for _ in range(count)]
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+    return columns
+
+def _arrow_table(names, rows, metadata):
+    arrays = []
+    for values in _columns(rows, len(names)):
+        if all(value is None or type(value) is int for value in values):
+            arrays.append(pyarrow.array(values, pyarrow.int64()))
+        else:
+            arrays.append(pyarrow.array([None if v is None else str(v) for v in values], pyarrow.string()))
+    return pyarrow.Table.from_arrays(arrays, names=list(names)).replace_schema_metadata(metadata)
+
+def _write_parquet(bundle, name, columns, rows, metadata):
+    buffer = pyarrow.BufferOutputStream()
+    pyarrow.parquet.write_table(_arrow_table(columns, rows, metadata), buffer, compression="zstd")
+    # Parquet pages are compressed already
+    bundle.writestr(name + ".parquet", buffer.getvalue().to_pybytes(), compress_type=zipfile.ZIP_STORED)
+
+def _write_csv(bundle, name, columns, rows, metadata):
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator="\n")
+    writer.writerow(columns)
+    writer.writerows(rows)
+    bundle.writestr(name + ".csv", text.getvalue().encode("utf-8"), compress_type=zipfile.ZIP_DEFLATED)
+
+def write(snap, fmt, path):
+    """Write the units and employees tables of ``snap`` to ``path`` as a zip of two ``fmt`` files."""
+    metadata = {"snapshot_version": snap.version, "loaded_at": repr(snap.loaded_at)}
+    write_table = _write_parquet if fmt == "parquet" else _write_csv
+    with zipfile.ZipFile(path, "w") as bundle:
+        bundle.comment = f"org snapshot {snap.version}".encode("ascii")
+        write_table(bundle, "units", UNIT_COLUMNS, list(unit_rows(snap)), metadata)
+        write_table(bundle, "employees", EMPLOYEE_COLUMNS, snap.rows, metadata)
+
+
+def file_name(snap, fmt):
+    return f"{FILE_PREFIX}{snap.version}.{fmt}.zip"
+
+# One build per file at a time within this worker
+_builds = SingleFlight("export")
+
+def ensure(snap, fmt):
+    """Path of the export of ``snap`` in ``fmt``, written on first request for each snapshot version.
+
+    Files go to EXPORT_DIR under the snapshot version, so every worker
+    sharing the directory serves the same file. They are written to a
+    temporary name and renamed, so a download never sees a partial one.
+    """
+    name = file_name(snap, fmt)
+    path = os.path.join(EXPORT_DIR, name)
+    if os.path.exists(path):
+        return path
+
+    def build():
+        if os.path.exists(path):
+            return path
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        write(snap, fmt, tmp)
+        os.replace(tmp, path)
+        _remove_old(snap.version)
+        return path
+    return _builds.do(name, build, fmt)
+
+def _remove_old(version):
+    """Keep the exports of the EXPORT_KEEP most recent snapshot versions (including ``version``)."""
+    files = [name for name in os.listdir(EXPORT_DIR) if name.startswith(FILE_PREFIX) and name.endswith(".zip")]
+    versions = {}
+    for name in files:
+        file_version = name[len(FILE_PREFIX):].split(".", 1)[0]
+        modified = os.path.getmtime(os.path.join(EXPORT_DIR, name))
+        versions[file_version] = max(versions.get(file_version, 0.0), modified)
+    versions.pop(version, None)
+    keep = {version} | set(sorted(versions, key=versions.get, reverse=True)[:max(EXPORT_KEEP - 1, 0)])
+    for name in files:
+        if name[len(FILE_PREFIX):].split(".", 1)[0] not in keep:
+            try:
+                os.remove(os.path.join(EXPORT_DIR, name))
+            except OSError:
+                pass  # still being downloaded (Windows), next time
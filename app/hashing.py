@@ -0,0 +1,164 @@
+import atexit
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from app import metrics
+from config import BCRYPT_PROCESSES, BCRYPT_LOGIN_PROCESSES, BCRYPT_LOGIN_QUEUE, WORKER_PROCESSES
+
+
+class Overloaded(Exception):
+    """Raised when too many password checks are already waiting."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Password verification is busy, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def hash_password(password):
+    """bcrypt hash of ``password`` (bytes), as stored in I_User."""
+    return bcrypt.hashpw(password, bcrypt.gensalt()).decode("utf-8")
+
+def check_password(password, hashed):
+    """(matches, seconds taken) for ``password`` against the bcrypt hash ``hashed``, both bytes."""
+    started = time.perf_counter()
+    return bcrypt.checkpw(password, hashed), time.perf_counter() - started
+
+def _cpus_per_worker():
+    # Each worker has its own pools, share the host's CPUs between them
+    return max(1, (os.cpu_count() or 1) // WORKER_PROCESSES)
+
+def pool_size():
+    return BCRYPT_PROCESSES or _cpus_per_worker()
+
+def login_pool_size():
+    return BCRYPT_LOGIN_PROCESSES or _cpus_per_worker()
+
+
+class _ProcessPool:
+    """ProcessPoolExecutor started on first use, kept for the life of the worker and replaced if broken."""
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._executor is None:
+                # Forking a process with running threads can copy a lock held
+                # by one of them; spawn (the only method on Windows) starts clean
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+                atexit.register(self._executor.shutdown, wait=False)
+            return self._executor
+
+    def discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+
+# Separate pools, so a bulk registration never holds up logins
+_hash_pool = _ProcessPool(pool_size())
+_login_pool = _ProcessPool(login_pool_size())
+
+def hash_passwords(passwords):
+    """Hash ``passwords`` across a pool of worker processes, results in the same order.
+
+    bcrypt is CPU bound, so threads would only take turns; processes hash
+    in parallel. The pool is started on first use and kept for the life of
+    the worker.
+    """
+    if len(passwords) < 2:
+        return [hash_password(password) for password in passwords]
+    pool = _hash_pool.get()
+    # A few chunks per process keeps them busy without a round trip per password
+    chunksize = max(1, len(passwords) // (pool_size() * 4))
+    try:
+        return list(pool.map(hash_password, passwords, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A worker died (killed, out of memory), start a fresh pool next time
+        _hash_pool.discard(pool)
+        raise
+
+
+class _Admission:
+    """Counts password checks in the login pool and refuses them beyond its capacity."""
+
+    def __init__(self, processes, queue):
+        self.processes = processes
+        self.capacity = processes + queue
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._average = 0.25  # seconds per check, moving average
+        self._rejected = 0
+
+    def _publish(self):
+        metrics.LOGIN_VERIFY_RUNNING.set(min(self._in_flight, self.processes))
+        metrics.LOGIN_VERIFY_QUEUE_DEPTH.set(max(0, self._in_flight - self.processes))
+
+    def enter(self):
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                # Time until the checks already admitted are done
+                retry_after = max(1, math.ceil(self._in_flight * self._average / self.processes))
+                metrics.LOGIN_VERIFY_REJECTED.inc()
+                raise Overloaded(retry_after)
+            self._in_flight += 1
+            self._publish()
+
+    def leave(self, seconds=None):
+        with self._lock:
+            self._in_flight -= 1
+            if seconds is not None:
+                self._average += (seconds - self._average) * 0.2
+            self._publish()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+                "average_ms": round(self._average * 1000, 3),
+            }
+
+
+_admission = _Admission(login_pool_size(), BCRYPT_LOGIN_QUEUE)
+
+def verify_password(password, hashed):
+    """Check a login password in the login process pool, off the request thread.
+
+    At most BCRYPT_LOGIN_QUEUE checks wait for a free process; past that
+    Overloaded is raised right away, with a Retry-After estimate, instead
+    of queueing work the client will likely time out on anyway.
+    """
+    _admission.enter()
+    seconds = None
+    pool = None
+    try:
+        pool = _login_pool.get()
+        ok, seconds = pool.submit(check_password, password, hashed).result()
+        metrics.LOGIN_VERIFY_SECONDS.observe(seconds)
+        return ok
+    except BrokenProcessPool:
+        _login_pool.discard(pool)
+        raise
+    finally:
+        _admission.leave(seconds)
+
+def start_login_pool():
+    """Start the login pool's processes now rather than on the first login."""
+    pool = _login_pool.get()
+    for future in [pool.submit(os.getpid) for _ in range(login_pool_size())]:
+        future.result()
+
+def login_stats():
+    return _admission.stats()
@@ -0,0 +1,129 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+from config import (
+    LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE_SIZE,
+    LOG_ERROR_SAMPLE_BURST, LOG_ERROR_SAMPLE_WINDOW
+)
+
+# Record attributes copied into the JSON line when present
+EXTRA_FIELDS = ("request_id", "method", "path", "status", "duration_ms", "remote_addr", "suppressed")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ErrorSampler(logging.Filter):
+    """Let the first LOG_ERROR_SAMPLE_BURST copies of an error through per window.
+
+    Errors are grouped by the line that logged them and the exception type.
+    The first record let through after a window with drops carries the
+    number of suppressed copies.
+    """
+
+    def __init__(self, burst=LOG_ERROR_SAMPLE_BURST, window=LOG_ERROR_SAMPLE_WINDOW):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.ERROR or self.burst <= 0:
+            return True
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.pathname, record.lineno, exc_type)
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._seen.get(key, (now, 0, 0))
+            if now - started >= self.window:
+                started, count = now, 0
+            count += 1
+            if count > self.burst:
+                self._seen[key] = (started, count, suppressed + 1)
+                return False
+            self._seen[key] = (started, count, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class RequestQueueHandler(QueueHandler):
+    """Hands records to the writer thread without blocking the request.
+
+    Request details are captured here, on the request thread, because the
+    writer has no request context. When the queue is full the record is
+    dropped and counted rather than waiting on the disk.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._formatter = JsonFormatter()
+
+    def prepare(self, record):
+        if has_request_context():
+            if getattr(record, "request_id", None) is None:
+                record.request_id = g.get("request_id")
+            if getattr(record, "path", None) is None:
+                record.method = request.method
+                record.path = request.path
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def init_logging(app, log_path):
+    """Route app.logger through a queue to a JSON rotating file written by a background thread."""
+    file_handler = RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = RequestQueueHandler(log_queue)
+    queue_handler.setLevel(LOG_LEVEL)
+    queue_handler.addFilter(ErrorSampler())
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.setLevel(LOG_LEVEL)
+    app.logger.addHandler(queue_handler)
+    if not app.debug:
+        # Flask's console handler writes synchronously, keep it for debugging only
+        app.logger.removeHandler(default_handler)
+    return queue_handler
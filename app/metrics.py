@@ -0,0 +1,229 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels, values):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labels, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, values)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            data = self._values.get(label_values)
+            if data is None:
+                data = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        labels = self.labels + ("le",)
+        with self._lock:
+            for values, data in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, data):
+                    lines.append(f"{self.name}_bucket{_label_text(labels, values + (bound,))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(labels, values + ('+Inf',))} {data[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, values)} {data[-2]}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, values)} {data[-1]}")
+        return lines
+
+
+REQUESTS = Counter("api_requests_total", "Requests handled", ("endpoint", "method", "status"))
+REQUEST_DURATION = Histogram("api_request_duration_seconds", "Time to produce the response", ("endpoint",))
+PHASE_DURATION = Histogram(
+    "api_request_phase_duration_seconds",
+    "Time spent per phase (db_connect, db_execute, db_fetch, coalesced_wait, build, serialize, compress, bcrypt)",
+    ("endpoint", "phase"),
+)
+ROWS = Histogram("api_request_db_rows", "Rows fetched from the database per request", ("endpoint",), ROW_BUCKETS)
+SLOW_REQUESTS = Counter("api_slow_requests_total", "Requests slower than SLOW_REQUEST_THRESHOLD_MS", ("endpoint",))
+STATEMENT_EXECUTIONS = Counter("api_db_statement_executions_total", "Executions per catalog statement", ("statement",))
+STATEMENT_SECONDS = Counter("api_db_statement_seconds_total", "Time spent executing each catalog statement", ("statement",))
+SINGLEFLIGHT_CALLS = Counter(
+    "api_singleflight_calls_total",
+    "Loader calls that ran (executed) or waited for an identical call already running (coalesced)",
+    ("group", "loader", "outcome"),
+)
+
+BREAKER_TRANSITIONS = Counter("api_db_breaker_transitions_total", "Circuit breaker state changes", ("pool", "state"))
+BREAKER_REJECTIONS = Counter("api_db_breaker_rejections_total", "Calls refused because the circuit breaker was open", ("pool",))
+STALE_RESPONSES = Counter("api_stale_responses_total", "Responses built from stale data because a database was unavailable", ("endpoint",))
+LOGIN_VERIFY_RUNNING = Gauge("api_login_verify_running", "Login password checks running in the bcrypt pool")
+LOGIN_VERIFY_QUEUE_DEPTH = Gauge("api_login_verify_queue_depth", "Login password checks waiting for a bcrypt process")
+LOGIN_VERIFY_REJECTED = Counter("api_login_verify_rejected_total", "Logins refused with 429 because the bcrypt queue was full")
+LOGIN_VERIFY_SECONDS = Histogram("api_login_verify_seconds", "Time bcrypt took to check a login password")
+
+COLLECTORS = [
+    REQUESTS, REQUEST_DURATION, PHASE_DURATION, ROWS, SLOW_REQUESTS,
+    STATEMENT_EXECUTIONS, STATEMENT_SECONDS, SINGLEFLIGHT_CALLS,
+    BREAKER_TRANSITIONS, BREAKER_REJECTIONS, STALE_RESPONSES,
+    LOGIN_VERIFY_RUNNING, LOGIN_VERIFY_QUEUE_DEPTH, LOGIN_VERIFY_REJECTED, LOGIN_VERIFY_SECONDS,
+]
+
+
+def endpoint_label():
+    """The route pattern of the current request, so ids don't explode label cardinality."""
+    rule = getattr(g, "_metrics_rule", None)
+    return rule or "unmatched"
+
+
+def record_phase(phase, seconds):
+    """Add ``seconds`` to ``phase`` of the current request, if there is one."""
+    if not has_request_context():
+        return
+    phases = g.setdefault("phases", {})
+    phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+def record_rows(count):
+    if has_request_context():
+        g.rows = g.get("rows", 0) + count
+
+
+@contextmanager
+def timed(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+def start_request(rule):
+    g._metrics_started = time.perf_counter()
+    g._metrics_rule = rule
+
+
+def finish_request(method, status):
+    """Record the request into the collectors. Returns (endpoint, seconds, phases, rows)."""
+    started = g.get("_metrics_started")
+    if started is None:
+        return None
+    elapsed = time.perf_counter() - started
+    endpoint = endpoint_label()
+    phases = g.get("phases", {})
+    rows = g.get("rows")
+    REQUESTS.inc(endpoint, method, status)
+    REQUEST_DURATION.observe(elapsed, endpoint)
+    for phase, seconds in phases.items():
+        PHASE_DURATION.observe(seconds, endpoint, phase)
+    if rows is not None:
+        ROWS.observe(rows, endpoint)
+    return endpoint, elapsed, phases, rows
+
+
+def pool_lines(pool_stats):
+    lines = []
+    gauges = (
+        ("in_use", "Connections checked out"),
+        ("idle", "Connections waiting in the pool"),
+        ("max_size", "Pool size limit"),
+    )
+    for key, help in gauges:
+        name = f"api_db_pool_{key}"
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+        lines += [f'{name}{{pool="{pool}"}} {stats[key]}' for pool, stats in sorted(pool_stats.items())]
+    counters = (
+        ("created", "Connections opened"),
+        ("checkouts", "Connections handed out"),
+        ("waits", "Checkouts that had to wait for a free connection"),
+        ("timeouts", "Checkouts that gave up waiting"),
+    )
+    for key, help in counters:
+        name = f"api_db_pool_{key}_total"
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{pool="{pool}"}} {stats[key]}' for pool, stats in sorted(pool_stats.items())]
+    name = "api_db_pool_wait_seconds_total"
+    lines += [f"# HELP {name} Time spent waiting for a free connection", f"# TYPE {name} counter"]
+    lines += [f'{name}{{pool="{pool}"}} {stats["wait_time_total_ms"] / 1000}' for pool, stats in sorted(pool_stats.items())]
+    name = "api_db_breaker_open"
+    lines += [f"# HELP {name} 1 while the circuit breaker refuses calls (open or half open)", f"# TYPE {name} gauge"]
+    lines += [f'{name}{{pool="{pool}"}} {int(stats["breaker"]["state"] != "closed")}' for pool, stats in sorted(pool_stats.items())]
+    return lines
+
+
+def startup_lines(report):
+    name = "api_startup_phase_seconds"
+    lines = [f"# HELP {name} Time spent in each startup step of this worker", f"# TYPE {name} gauge"]
+    lines += [f'{name}{{phase="{_escape(phase)}"}} {seconds}' for phase, seconds in report.phases.items()]
+    name = "api_startup_failed_steps"
+    lines += [f"# HELP {name} Warm-up steps that failed", f"# TYPE {name} gauge", f"{name} {len(report.errors)}"]
+    return lines
+
+
+def render(pool_stats=None, startup_report=None):
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for collector in COLLECTORS:
+        lines += collector.render()
+    if pool_stats:
+        lines += pool_lines(pool_stats)
+    if startup_report:
+        lines += startup_lines(startup_report)
+    return "\n".join(lines) + "\n"
@@ -1,22 +1,31 @@
+import threading
+import time
+from contextlib import contextmanager
 import pyodbc
+from app import metrics
+from app.breaker import CircuitBreaker
 from config import (
-    AUTH_DB_DRIVER, AUTH_DB_SERVER, AUTH_DB_NAME,
+    get_odbc_driver,
+    AUTH_DB_SERVER, AUTH_DB_NAME,
     AUTH_DB_USERNAME, AUTH_DB_PASSWORD,
-    INFO_DB_DRIVER, INFO_DB_SERVER, INFO_DB_NAME,
-    INFO_DB_USERNAME, INFO_DB_PASSWORD
+    INFO_DB_SERVER, INFO_DB_NAME,
+    INFO_DB_USERNAME, INFO_DB_PASSWORD,
+    DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_IDLE,
+    DB_POOL_MAX_LIFETIME, DB_POOL_PING_AFTER, DB_CONNECT_TIMEOUT, DB_QUERY_TIMEOUT
 )
 
 def get_auth_db_connection():
     try:
         conn = pyodbc.connect(
-            f"DRIVER={AUTH_DB_DRIVER};"
+            f"DRIVER={get_odbc_driver('AUTH_DB_DRIVER')};"
             f"SERVER={AUTH_DB_SERVER};"
             f"DATABASE={AUTH_DB_NAME};"
             f"UID={AUTH_DB_USERNAME};"
             f"PWD={AUTH_DB_PASSWORD};"
             "TrustServerCertificate=yes;"
-            "Connection Timeout=5;"
+            f"Connection Timeout={DB_CONNECT_TIMEOUT};"
         )
+        conn.timeout = DB_QUERY_TIMEOUT
         return conn
     except pyodbc.Error as e:
         raise ConnectionError(f"Authentication database connection failed: {e}")
@@ -24,14 +33,304 @@ def get_auth_db_connection():
 def get_info_db_connection():
     try:
         conn = pyodbc.connect(
-            f"DRIVER={INFO_DB_DRIVER};"
+            f"DRIVER={get_odbc_driver('INFO_DB_DRIVER')};"
             f"SERVER={INFO_DB_SERVER};"
             f"DATABASE={INFO_DB_NAME};"
             f"UID={INFO_DB_USERNAME};"
             f"PWD={INFO_DB_PASSWORD};"
             "TrustServerCertificate=yes;"
-            "Connection Timeout=5;"
+            f"Connection Timeout={DB_CONNECT_TIMEOUT};"
         )
+        conn.timeout = DB_QUERY_TIMEOUT
         return conn
     except pyodbc.Error as e:
         raise ConnectionError(f"Information database connection failed: {e}")
+
+
+class PoolTimeoutError(ConnectionError):
+    pass
+
+
+class _TimedCursor:
+    """pyodbc cursor that reports execute/fetch time and rows to app.metrics."""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, "_cursor", cursor)
+
+    def execute(self, *args):
+        with metrics.timed("db_execute"):
+            self._cursor.execute(*args)
+        return self
+
+    def executemany(self, *args):
+        with metrics.timed("db_execute"):
+            self._cursor.executemany(*args)
+
+    def fetchone(self):
+        with metrics.timed("db_fetch"):
+            row = self._cursor.fetchone()
+        metrics.record_rows(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, *args):
+        with metrics.timed("db_fetch"):
+            rows = self._cursor.fetchmany(*args)
+        metrics.record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        with metrics.timed("db_fetch"):
+            rows = self._cursor.fetchall()
+        metrics.record_rows(len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+class _TimedConnection:
+    """pyodbc connection whose cursors are timed."""
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+
+    def cursor(self):
+        return _TimedCursor(self._conn.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """Bounded pool of pyodbc connections for one database.
+
+    Connections are reused across requests instead of paying the TLS
+    handshake and login on every call. Idle connections older than
+    ``max_idle`` seconds or alive longer than ``max_lifetime`` seconds are
+    recycled, and connections that sat idle longer than ``ping_after``
+    seconds are checked with ``SELECT 1`` before being handed out.
+
+    Each pool has a circuit breaker: once the database keeps failing,
+    connection() fails fast with CircuitOpenError instead of waiting for
+    the connect timeout on every request.
+    """
+
+    def __init__(self, name, connect, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 max_idle=DB_POOL_MAX_IDLE, max_lifetime=DB_POOL_MAX_LIFETIME,
+                 ping_after=DB_POOL_PING_AFTER):
+        self.name = name
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.breaker = CircuitBreaker(name)
+
+        self._lock = threading.Condition()
+        self._idle = []  # LIFO, so hot connections stay hot and cold ones age out
+        self._in_use = 0
+
+        # Stats
+        self._created = 0
+        self._recycled = 0
+        self._broken = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    def _expired(self, pooled, now):
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            return True
+        if self.max_idle and now - pooled.last_used > self.max_idle:
+            return True
+        return False
+
+    def _healthy(self, pooled, now):
+        if not self.ping_after or now - pooled.last_used < self.ping_after:
+            return True
+        try:
+            cursor = pooled.conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _close(self, pooled):
+        try:
+            pooled.conn.close()
+        except pyodbc.Error:
+            pass
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._lock:
+            while not self._idle and self._in_use >= self.max_size:
+                waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a {self.name} database connection"
+                    )
+                self._lock.wait(remaining)
+            pooled = self._idle.pop() if self._idle else None
+            self._in_use += 1
+            self._checkouts += 1
+            if waited:
+                elapsed = time.monotonic() - started
+                self._waits += 1
+                self._wait_time += elapsed
+                self._max_wait_time = max(self._max_wait_time, elapsed)
+
+        # Validation and connect happen outside the lock so a slow server
+        # does not block other threads from returning connections.
+        try:
+            now = time.monotonic()
+            if pooled is not None and self._expired(pooled, now):
+                self._close(pooled)
+                pooled = None
+                with self._lock:
+                    self._recycled += 1
+            if pooled is not None and not self._healthy(pooled, now):
+                self._close(pooled)
+                pooled = None
+                with self._lock:
+                    self._broken += 1
+            if pooled is None:
+                pooled = _PooledConnection(self._connect())
+                with self._lock:
+                    self._created += 1
+            return pooled
+        except BaseException:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, pooled, discard=False):
+        if discard:
+            self._close(pooled)
+        else:
+            pooled.last_used = time.monotonic()
+        with self._lock:
+            self._in_use -= 1
+            if discard:
+                self._broken += 1
+            else:
+                self._idle.append(pooled)
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        self.breaker.allow()
+        try:
+            with metrics.timed("db_connect"):
+                pooled = self.acquire()
+        except PoolTimeoutError:
+            # All connections busy is load, not a database failure
+            self.breaker.release_probe()
+            raise
+        except ConnectionError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        try:
+            yield _TimedConnection(pooled.conn)
+        except pyodbc.Error as e:
+            # The connection may be in an unknown state, never hand it out again
+            self.release(pooled, discard=True)
+            if isinstance(e, (pyodbc.OperationalError, pyodbc.InterfaceError)):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            # An error of the caller's, not of the database
+            self.breaker.release_probe()
+            try:
+                pooled.conn.rollback()
+            except pyodbc.Error:
+                self.release(pooled, discard=True)
+                raise
+            self.release(pooled)
+            raise
+        else:
+            self.breaker.record_success()
+            try:
+                pooled.conn.rollback()  # drop any uncommitted work before reuse
+            except pyodbc.Error:
+                self.release(pooled, discard=True)
+                return
+            self.release(pooled)
+
+    def prefill(self, count):
+        """Open connections until ``count`` (at most max_size) exist. Returns how many were opened."""
+        opened = 0
+        while True:
+            with self._lock:
+                if len(self._idle) + self._in_use >= min(count, self.max_size):
+                    return opened
+            pooled = _PooledConnection(self._connect())
+            with self._lock:
+                self._created += 1
+                self._idle.append(pooled)
+                self._lock.notify()
+            opened += 1
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self._created,
+                "recycled": self._recycled,
+                "broken": self._broken,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_time_total_ms": round(self._wait_time * 1000, 3),
+                "wait_time_max_ms": round(self._max_wait_time * 1000, 3),
+                "breaker": self.breaker.stats(),
+            }
+
+
+auth_pool = ConnectionPool("auth", get_auth_db_connection)
+info_pool = ConnectionPool("info", get_info_db_connection)
+
+def auth_db_connection():
+    return auth_pool.connection()
+
+def info_db_connection():
+    return info_pool.connection()
+
+def get_pool_stats():
+    return {"auth": auth_pool.stats(), "info": info_pool.stats()}
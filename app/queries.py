@@ -0,0 +1,311 @@
+import threading
+import time
+from collections import OrderedDict
+from app import metrics, breaker
+from app.singleflight import SingleFlight
+from config import BATCH_QUERY_CHUNK, STALE_CACHE_ROWS, STALE_MAX_AGE
+
+# Every statement the app sends, by name. SQL text never contains values,
+# so SQL Server compiles each statement once and reuses the cached plan.
+CATALOG = {}
+_catalog_lock = threading.Lock()
+
+
+class Query:
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        with _catalog_lock:
+            if name in CATALOG:
+                raise ValueError(f"Duplicate statement name {name!r}")
+            CATALOG[name] = self
+
+    def __repr__(self):
+        return f"Query({self.name!r})"
+
+
+def execute(cursor, query, params=()):
+    """Run a catalog statement on ``cursor`` and count it."""
+    started = time.perf_counter()
+    try:
+        if params:
+            cursor.execute(query.sql, params)
+        else:
+            cursor.execute(query.sql)
+    finally:
+        metrics.STATEMENT_EXECUTIONS.inc(query.name)
+        metrics.STATEMENT_SECONDS.inc(query.name, amount=time.perf_counter() - started)
+    return cursor
+
+def executemany(cursor, query, seq_of_params):
+    started = time.perf_counter()
+    try:
+        cursor.executemany(query.sql, seq_of_params)
+    finally:
+        metrics.STATEMENT_EXECUTIONS.inc(query.name)
+        metrics.STATEMENT_SECONDS.inc(query.name, amount=time.perf_counter() - started)
+    return cursor
+
+# Identical reads (same statement and parameters) running at the same time
+_reads = SingleFlight("db_read")
+
+# (time fetched, rows) of the most recent distinct reads, STALE_CACHE_ROWS
+# rows in all, served when the database can't be reached
+_last_good = OrderedDict()
+_last_good_rows_total = 0
+_last_good_lock = threading.Lock()
+
+def _remember(key, rows):
+    global _last_good_rows_total
+    size = max(len(rows), 1)
+    if size > STALE_CACHE_ROWS:
+        return  # would push out everything else
+    with _last_good_lock:
+        previous = _last_good.pop(key, None)
+        if previous is not None:
+            _last_good_rows_total -= max(len(previous[1]), 1)
+        _last_good[key] = (time.time(), rows)
+        _last_good_rows_total += size
+        while _last_good_rows_total > STALE_CACHE_ROWS:
+            _, (_, dropped) = _last_good.popitem(last=False)
+            _last_good_rows_total -= max(len(dropped), 1)
+
+def _last_good_rows(key):
+    with _last_good_lock:
+        entry = _last_good.get(key)
+    if entry is None:
+        return None, None
+    fetched_at, rows = entry
+    age = time.time() - fetched_at
+    if STALE_MAX_AGE and age > STALE_MAX_AGE:
+        return None, None
+    return rows, age
+
+def fetch_all(connection, query, params=(), stale_ok=True):
+    """All rows of the read statement ``query``, run on a connection from ``connection()``.
+
+    Concurrent calls with the same statement and parameters wait for the
+    one already running and share its rows (treat them as read-only).
+    If the database is unavailable and ``stale_ok``, the rows of the last
+    successful identical read are returned instead and the response is
+    marked stale.
+    """
+    def load():
+        with connection() as conn:
+            cursor = conn.cursor()
+            execute(cursor, query, params)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+    key = (query.name, tuple(params))
+    remember = stale_ok and STALE_CACHE_ROWS > 0
+    try:
+        rows = _reads.do(key, load, query.name)
+    except breaker.UNAVAILABLE_ERRORS:
+        if not remember:
+            raise
+        rows, age = _last_good_rows(key)
+        if rows is None:
+            raise
+        breaker.mark_stale(age)
+        return rows
+    if remember:
+        _remember(key, rows)
+    return rows
+
+def stats():
+    """{statement name: {"executions", "seconds"}} for every statement run so far."""
+    with _catalog_lock:
+        names = sorted(CATALOG)
+    result = {}
+    for name in names:
+        executions = metrics.STATEMENT_EXECUTIONS.value(name)
+        if executions:
+            result[name] = {
+                "executions": executions,
+                "seconds": round(metrics.STATEMENT_SECONDS.value(name), 6),
+            }
+    return result
+
+
+# I_User (AUTH database)
+INSERT_USER = Query("insert_user", "INSERT INTO I_User (username, password) VALUES (?, ?)")
+USER_CREDENTIALS = Query("user_credentials", "SELECT username, password FROM I_User WHERE username = ?")
+
+# I_TokenRevocation (AUTH database): refresh tokens revoked before they expire
+REVOKE_TOKEN = Query("revoke_token", "INSERT INTO I_TokenRevocation (jti, username, expires_at) VALUES (?, ?, ?)")
+REVOKED_TOKENS = Query("revoked_tokens", "SELECT jti FROM I_TokenRevocation WHERE expires_at > ?")
+PURGE_REVOKED_TOKENS = Query("purge_revoked_tokens", "DELETE FROM I_TokenRevocation WHERE expires_at <= ?")
+
+# Org snapshot, one row per employee ordered so every unit's rows are contiguous
+_SNAPSHOT_COLUMNS = """SELECT dir, dirName, div, div_name, dept, deptName, sec, subsec, idLokasi,
+       npk, username, name, email, jabatan
+FROM HRIS_TrAD"""
+SNAPSHOT = Query("snapshot", _SNAPSHOT_COLUMNS + """
+ORDER BY dir, div, dept, sec, subsec, npk""")
+# Same rows, limited to the directorate of one employee
+DIRECTORATE_SNAPSHOT = Query("snapshot_directorate", _SNAPSHOT_COLUMNS + """
+WHERE dir IN (SELECT dir FROM HRIS_TrAD WHERE npk = ?)
+ORDER BY dir, div, dept, sec, subsec, npk""")
+
+# GET /users, keyset-paginated on NPK when after/limit are given
+USERS_COLUMNS = "npk, name, email, jabatan, dirName, div_name, deptName"
+USERS_ALL = Query("users", f"SELECT {USERS_COLUMNS} FROM HRIS_TrAD")
+USERS_FIRST_PAGE = Query("users_first_page", f"SELECT TOP (?) {USERS_COLUMNS} FROM HRIS_TrAD ORDER BY npk")
+USERS_AFTER = Query("users_after", f"SELECT {USERS_COLUMNS} FROM HRIS_TrAD WHERE npk > ? ORDER BY npk")
+USERS_PAGE = Query("users_page", f"SELECT TOP (?) {USERS_COLUMNS} FROM HRIS_TrAD WHERE npk > ? ORDER BY npk")
+
+def users(after=None, limit=None):
+    """(query, params) for /users."""
+    if limit and after is not None:
+        return USERS_PAGE, [limit, after]
+    if limit:
+        return USERS_FIRST_PAGE, [limit]
+    if after is not None:
+        return USERS_AFTER, [after]
+    return USERS_ALL, []
+
+USER_BY_NPK = Query("user_by_npk", "SELECT npk, name, email, jabatan FROM HRIS_TrAD WHERE npk = ?")
+USER_BY_USERNAME = Query(
+    "user_by_username", "SELECT npk, username, name, email, jabatan FROM HRIS_TrAD WHERE username = ?"
+)
+
+# GET /structures: the columns each level selects, the ORDER BY that keeps
+# every unit's rows together for the tree builder, and the optional filters
+STRUCTURE_COLUMNS = {
+    "dir": "dir, dirName, idLokasi",
+    "div": "dir, dirName, div, div_name, idLokasi",
+    "dpt": "dir, dirName, div, div_name, dept, deptName, idLokasi",
+    "sct": "dir, dirName, div, div_name, dept, deptName, sec, idLokasi",
+    "subsect": "dir, dirName, div, div_name, dept, deptName, sec, subsec, idLokasi",
+}
+STRUCTURE_ORDER_BY = {
+    "dir": "dir",
+    "div": "dir, div",
+    "dpt": "dir, div, dept",
+    "sct": "dir, div, dept, sec",
+    "subsect": "dir, div, dept, sec, subsec",
+}
+STRUCTURE_FILTERS = (("dirname", "dir"), ("divname", "div_name"), ("dptname", "deptName"))
+
+def _structure_query(level, filters):
+    sql = f"SELECT DISTINCT {STRUCTURE_COLUMNS[level]} FROM HRIS_TrAD"
+    if filters:
+        sql += " WHERE " + " AND ".join(f"{column} = ?" for _, column in filters)
+    sql += f" ORDER BY {STRUCTURE_ORDER_BY[level]}"
+    return Query("structures_" + level + "".join(f"_by_{arg}" for arg, _ in filters), sql)
+
+# One statement per level x combination of filters given
+STRUCTURES = {
+    (level, mask): _structure_query(level, [f for i, f in enumerate(STRUCTURE_FILTERS) if mask & (1 << i)])
+    for level in STRUCTURE_COLUMNS
+    for mask in range(1 << len(STRUCTURE_FILTERS))
+}
+
+def structures(level, dirname=None, divname=None, dptname=None):
+    """(query, params) for /structures; empty filters are ignored."""
+    mask, params = 0, []
+    for i, value in enumerate((dirname, divname, dptname)):
+        if value:
+            mask |= 1 << i
+            params.append(value)
+    return STRUCTURES[(level, mask)], params
+
+# Sparse /structures (?fields=, ?depth=, ?root=): only the codes of the
+# levels returned and the fields asked for of the deepest one are selected
+STRUCTURE_LEVELS = ("dir", "div", "dpt", "sct", "subsect")
+# (code, name) column of each level; sections are named by their code
+STRUCTURE_LEVEL_COLUMNS = (("dir", "dirName"), ("div", "div_name"), ("dept", "deptName"), ("sec", "sec"), ("subsec", "subsec"))
+STRUCTURE_FIELDS = ("name", "lokasi")
+# Levels a response can start at (those with a code of their own)
+STRUCTURE_ROOT_LEVELS = ("dir", "div", "dpt")
+
+_sparse_structures = {}
+_sparse_structures_lock = threading.Lock()
+
+def structure_columns(top, bottom, fields):
+    """Columns of a sparse /structures row: codes of levels ``top``..``bottom``, then ``fields`` of ``bottom``."""
+    columns = [code for code, _ in STRUCTURE_LEVEL_COLUMNS[top:bottom + 1]]
+    code, name = STRUCTURE_LEVEL_COLUMNS[bottom]
+    if "name" in fields and name != code:
+        columns.append(name)
+    if "lokasi" in fields:
+        columns.append("idLokasi")
+    return columns
+
+def sparse_structures(top, bottom, fields, root=None, dirname=None, divname=None, dptname=None):
+    """(query, params) for a sparse /structures, optionally under the ``top`` level unit coded ``root``."""
+    filters = [(arg, column) for (arg, column), value in zip(STRUCTURE_FILTERS, (dirname, divname, dptname)) if value]
+    params = [value for value in (dirname, divname, dptname) if value]
+    if root is not None:
+        filters.insert(0, ("root", STRUCTURE_LEVEL_COLUMNS[top][0]))
+        params.insert(0, root)
+    fields = [f for f in STRUCTURE_FIELDS if f in fields]
+    name = (f"structures_{STRUCTURE_LEVELS[top]}_to_{STRUCTURE_LEVELS[bottom]}"
+            + "".join(f"_with_{f}" for f in fields) + "".join(f"_by_{arg}" for arg, _ in filters))
+    query = _sparse_structures.get(name)
+    if query is None:
+        with _sparse_structures_lock:
+            query = _sparse_structures.get(name)
+            if query is None:
+                codes = [code for code, _ in STRUCTURE_LEVEL_COLUMNS[top:bottom + 1]]
+                sql = f"SELECT DISTINCT {', '.join(structure_columns(top, bottom, fields))} FROM HRIS_TrAD"
+                if filters:
+                    sql += " WHERE " + " AND ".join(f"{column} = ?" for _, column in filters)
+                sql += f" ORDER BY {', '.join(codes)}"
+                query = _sparse_structures[name] = Query(name, sql)
+    return query, params
+
+STRUCTURES_BY_DIR = Query(
+    "structures_of_dir",
+    "SELECT dir, dirName, div, div_name, dept, deptName, npk, name, email, jabatan "
+    "FROM HRIS_TrAD WHERE dir = ? ORDER BY dir, div, dept, npk",
+)
+STRUCTURES_BY_DIV = Query(
+    "structures_of_div",
+    "SELECT div, div_name, dept, deptName, npk, name, email, jabatan "
+    "FROM HRIS_TrAD WHERE div = ? ORDER BY div, dept, npk",
+)
+
+# GET /users/search without the snapshot: prefix match, with and without NPK (also by prefix, like the snapshot index)
+_SEARCH_WHERE = "WHERE name LIKE ? OR username LIKE ? OR email LIKE ?{npk}"
+_SEARCH_NPK = " OR CAST(npk AS varchar(20)) LIKE ?"
+_SEARCH_SQL = "SELECT TOP (?) npk, username, name, email, jabatan FROM HRIS_TrAD " + _SEARCH_WHERE + " ORDER BY name, npk"
+SEARCH_USERS = Query("search_users", _SEARCH_SQL.format(npk=""))
+SEARCH_USERS_OR_NPK = Query("search_users_or_npk", _SEARCH_SQL.format(npk=_SEARCH_NPK))
+# Number of matches past the TOP, so "total" means the same as from the snapshot index
+_SEARCH_COUNT_SQL = "SELECT COUNT(*) FROM HRIS_TrAD " + _SEARCH_WHERE
+COUNT_SEARCH_USERS = Query("count_search_users", _SEARCH_COUNT_SQL.format(npk=""))
+COUNT_SEARCH_USERS_OR_NPK = Query("count_search_users_or_npk", _SEARCH_COUNT_SQL.format(npk=_SEARCH_NPK))
+
+
+# IN (...) lists are padded up to a power of two (capped at BATCH_QUERY_CHUNK)
+# by repeating the last value, so any list size maps to a handful of statements
+_in_lists = {}
+_in_lists_lock = threading.Lock()
+
+def _bucket(count):
+    size = 1
+    while size < count:
+        size *= 2
+    return min(size, BATCH_QUERY_CHUNK)
+
+def in_list(name, sql, values):
+    """(query, params) for ``sql`` with ``{in}`` replaced by a padded placeholder list.
+
+    ``values`` must be non-empty and at most BATCH_QUERY_CHUNK long.
+    """
+    size = _bucket(len(values))
+    key = (name, size)
+    query = _in_lists.get(key)
+    if query is None:
+        with _in_lists_lock:
+            query = _in_lists.get(key)
+            if query is None:
+                query = _in_lists[key] = Query(f"{name}[{size}]", sql.format(**{"in": ", ".join("?" * size)}))
+    return query, list(values) + [values[-1]] * (size - len(values))
+
+BATCH_LOOKUP_COLUMNS = "npk, username, name, email, jabatan"
+USERS_BY_NPKS = f"SELECT {BATCH_LOOKUP_COLUMNS} FROM HRIS_TrAD WHERE npk IN ({{in}})"
+USERS_BY_USERNAMES = f"SELECT {BATCH_LOOKUP_COLUMNS} FROM HRIS_TrAD WHERE username IN ({{in}})"
+EXISTING_USERNAMES = "SELECT username FROM I_User WHERE username IN ({in})"
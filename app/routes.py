@@ -1,11 +1,19 @@
 import bcrypt
 import jwt
 import datetime
+import hmac
 import logging
-import secrets
-import hashlib
-from flask import current_app as app,jsonify, request
-from app.models import get_auth_db_connection, get_info_db_connection
+import math
+import pyodbc
+from contextlib import ExitStack
+from flask import current_app as app,jsonify, request, Response, send_file
+from app.models import auth_db_connection, info_db_connection, get_pool_stats
+from app.breaker import CircuitOpenError
+from app import snapshot, tree, metrics, hashing, queries, encoding, conditional, tokens, export
+from config import (
+    USERS_PAGE_MAX, USERS_STREAM_BATCH, BATCH_LOOKUP_MAX, BATCH_QUERY_CHUNK, REGISTER_BULK_MAX,
+    SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, ACCESS_TOKEN_TTL, CACHE_CONTROL, METRICS_TOKEN
+)
 from functools import wraps
 
 def token_required(f):
@@ -25,6 +33,274 @@ def token_required(f):
         return f(*args, **kwargs)
     return decorated
 
+def metrics_token_required(f):
+    """token_required, or the fixed METRICS_TOKEN a scraper can send, as its JWTs would expire."""
+    protected = token_required(f)
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if METRICS_TOKEN and hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + METRICS_TOKEN):
+            return f(*args, **kwargs)
+        return protected(*args, **kwargs)
+    return decorated
+
+def service_unavailable(e):
+    """503 for a database whose circuit breaker is open, telling the client when to retry."""
+    response = jsonify({"error": "Service temporarily unavailable"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(math.ceil(e.retry_after))
+    return response
+
+def user_row_to_dict(row):
+    npk, name, email, jabatan, dir,div,dept = row
+    return {
+        "NPK": npk,
+        "NAME": name,
+        "EMAIL": email,
+        "ROLE": jabatan,
+        "Directorat" : dir,
+        "Division" : div,
+        "Dept" : dept
+    }
+
+def open_users_cursor(query, params):
+    """Run the /users ``query`` and return (cursor, stack), ``stack`` holding its pooled connection.
+
+    Done in the view, before any header is sent, so an unreachable database,
+    an open breaker or a pool timeout still becomes a 500/503. Close
+    ``stack`` to give the connection back.
+    """
+    with ExitStack() as stack:
+        conn = stack.enter_context(info_db_connection())
+        cursor = conn.cursor()
+        queries.execute(cursor, query, params)
+        return cursor, stack.pop_all()
+
+def stream_users(cursor, stack, mode, limit, dumps, logger):
+    """Yield /users rows from ``cursor`` as NDJSON lines or as one JSON document, USERS_STREAM_BATCH rows at a time.
+
+    Runs after the view has returned, so it gets the JSON encoder and logger
+    passed in instead of using the app context. With ``limit``, the NPK to
+    pass as ?after= ends the output: a "next_after" field in json mode, a
+    last {"next_after": ...} line in ndjson mode.
+    """
+    total = 0
+    last_npk = None
+    try:
+        with stack:
+            if mode == "json":
+                yield '{"status": "Success", "users": ['
+            while True:
+                rows = cursor.fetchmany(USERS_STREAM_BATCH)
+                if not rows:
+                    break
+                if mode == "ndjson":
+                    yield "".join(dumps(user_row_to_dict(row)) + "\n" for row in rows)
+                else:
+                    yield ("," if total else "") + ",".join(dumps(user_row_to_dict(row)) for row in rows)
+                total += len(rows)
+                last_npk = rows[-1][0]
+            cursor.close()
+        next_after = last_npk if limit and total == limit else None
+        if mode == "json":
+            paging = f', "next_after": {dumps(next_after)}' if limit else ""
+            yield f'], "total_users": {total}{paging}}}'
+        elif limit:
+            yield dumps({"next_after": next_after}) + "\n"
+    except Exception as e:
+        # Headers are already sent, the client sees a truncated body
+        logger.error(f"Error streaming /users after {total} rows: {e}", exc_info=True)
+
+def batch_user_info(npk, username, name, email, jabatan):
+    return {
+        "NPK": npk,
+        "NAME": name,
+        "USERNAME": username,
+        "EMAIL": email,
+        "ROLE": jabatan,
+    }
+
+def lookup_users(npks, usernames):
+    """Resolve NPKs and usernames to employees in as few round trips as possible.
+
+    Returns ``(by_npk, by_username)`` holding only the identifiers that were
+    found; usernames are matched case-insensitively. Uses the org snapshot
+    when loaded, otherwise one IN (...) query per BATCH_QUERY_CHUNK ids.
+    """
+    by_npk, by_username = {}, {}
+    snap = snapshot.current()
+    if snap is not None:
+        columns = (snapshot.NPK, snapshot.USERNAME, snapshot.NAME, snapshot.EMAIL, snapshot.JABATAN)
+        for npk in npks:
+            row = snap.employees_by_npk.get(npk)
+            if row is not None:
+                by_npk[npk] = batch_user_info(*(row[c] for c in columns))
+        for username in usernames:
+            row = snap.employees_by_username.get(username.lower())
+            if row is not None:
+                by_username[username.lower()] = batch_user_info(*(row[c] for c in columns))
+        return by_npk, by_username
+
+    with info_db_connection() as conn:
+        cursor = conn.cursor()
+        for name, sql, values, found, key in (
+            ("users_by_npks", queries.USERS_BY_NPKS, npks, by_npk, lambda row: row[0]),
+            ("users_by_usernames", queries.USERS_BY_USERNAMES, usernames, by_username, lambda row: row[1].lower()),
+        ):
+            values = list(dict.fromkeys(values))
+            for i in range(0, len(values), BATCH_QUERY_CHUNK):
+                query, params = queries.in_list(name, sql, values[i:i + BATCH_QUERY_CHUNK])
+                queries.execute(cursor, query, params)
+                for row in cursor.fetchall():
+                    info = batch_user_info(*row)
+                    found[key(row)] = info
+        cursor.close()
+    return by_npk, by_username
+
+def existing_usernames(usernames):
+    """Lowercased usernames from ``usernames`` that are already in I_User."""
+    existing = set()
+    with auth_db_connection() as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(usernames), BATCH_QUERY_CHUNK):
+            query, params = queries.in_list("existing_usernames", queries.EXISTING_USERNAMES, usernames[i:i + BATCH_QUERY_CHUNK])
+            queries.execute(cursor, query, params)
+            existing.update(row[0].lower() for row in cursor.fetchall())
+        cursor.close()
+    return existing
+
+def search_users_db(q, limit):
+    """Prefix match on name, username, email and NPK for when the org snapshot isn't loaded.
+
+    Returns (total matches, first ``limit`` users). No leading wildcard, so
+    the columns' indexes can still be used.
+    """
+    pattern = q.replace("[", "[[]").replace("%", "[%]").replace("_", "[_]") + "%"
+    query, count_query, params = queries.SEARCH_USERS, queries.COUNT_SEARCH_USERS, [pattern, pattern, pattern]
+    if q.isdigit():
+        query, count_query = queries.SEARCH_USERS_OR_NPK, queries.COUNT_SEARCH_USERS_OR_NPK
+        params.append(pattern)
+    rows = queries.fetch_all(info_db_connection, query, [limit] + params)
+    total = len(rows)
+    if total == limit:
+        # Only a full page can have more matches behind it
+        total = queries.fetch_all(info_db_connection, count_query, params)[0][0]
+    return total, [batch_user_info(*row) for row in rows]
+
+def snapshot_response(snap, build):
+    """Response for the encoding.Payload that ``build()`` makes from ``snap``.
+
+    The ETag depends only on the snapshot version and the request, so a
+    client that already has it gets a 304 without ``build`` being called.
+    X-Snapshot-Version is the version to pass to /structures/changes.
+    """
+    etag = conditional.snapshot_etag(snap.version)
+    if conditional.is_fresh(etag):
+        response = conditional.not_modified(Response, etag)
+    else:
+        with metrics.timed("build"):
+            payload = build()
+        response = conditional.cache_headers(payload.response(Response), etag)
+    response.headers["X-Snapshot-Version"] = snap.version
+    return response
+
+SNAPSHOT_USER_COLUMNS = (
+    snapshot.NPK, snapshot.NAME, snapshot.EMAIL, snapshot.JABATAN,
+    snapshot.DIRNAME, snapshot.DIVNAME, snapshot.DEPTNAME,
+)
+
+def snapshot_users_payload(snap):
+    """The whole unpaged /users document from the snapshot, ordered by NPK."""
+    rows = sorted(snap.rows, key=lambda row: row[snapshot.NPK])
+    users = [user_row_to_dict(tuple(row[c] for c in SNAPSHOT_USER_COLUMNS)) for row in rows]
+    return encoding.Payload(encoding.dumps_bytes({"status": "Success", "total_users": len(users), "users": users}))
+
+def sparse_structures(level, dirname, divname, dptname):
+    """/structures narrowed to what the caller asked for.
+
+    ?fields=name,lokasi of the deepest level (empty: codes only), ?depth=
+    levels returned counting from the top of the response, ?root=code of
+    the unit to start at, a directorate unless prefixed div: or dpt:.
+    Empty child lists are left out.
+    """
+    fields = queries.STRUCTURE_FIELDS
+    if "fields" in request.args:
+        fields = tuple(f.strip().lower() for f in request.args["fields"].split(",") if f.strip())
+        if any(f not in queries.STRUCTURE_FIELDS for f in fields):
+            return jsonify({"error": "Invalid fields parameter"}), 400
+
+    top, root = 0, None
+    if "root" in request.args:
+        root_level, _, root = request.args["root"].rpartition(":")
+        root_level = root_level.lower() or "dir"
+        if root_level not in queries.STRUCTURE_ROOT_LEVELS or not root:
+            return jsonify({"error": "Invalid root parameter"}), 400
+        top = queries.STRUCTURE_LEVELS.index(root_level)
+
+    bottom = queries.STRUCTURE_LEVELS.index(level)
+    if top > bottom:
+        return jsonify({"error": "root must be at or above level"}), 400
+    if "depth" in request.args:
+        try:
+            depth = int(request.args["depth"])
+        except ValueError:
+            depth = 0
+        if depth < 1:
+            return jsonify({"error": "Invalid depth parameter"}), 400
+        bottom = min(bottom, top + depth - 1)
+
+    levels = tree.sparse_structure_levels(top, bottom, fields)
+
+    snap = snapshot.current()
+    if snap is not None:
+        def build():
+            columns = [snapshot.SQL_COLUMNS[c] for c in queries.structure_columns(top, bottom, fields)]
+            root_column = snapshot.SQL_COLUMNS[queries.STRUCTURE_LEVEL_COLUMNS[top][0]] if root else None
+            rows = snap.sparse_structure_rows(columns, root_column, root, dirname, divname, dptname)
+            return encoding.Payload(tree.tree_json(rows, levels))
+        return snapshot_response(snap, lambda: snap.memo(
+            ("structures_sparse", top, bottom, fields, root, dirname, divname, dptname), build
+        ))
+
+    query, params = queries.sparse_structures(top, bottom, fields, root, dirname, divname, dptname)
+    rows = queries.fetch_all(info_db_connection, query, params)
+    return Response(tree.tree_json(rows, levels), mimetype="application/json")
+
+APPROVAL_LEVEL_NAMES = {
+    "subsect": "SUBSECTION",
+    "sct": "SECTION",
+    "dpt": "DEPARTMENT",
+    "div": "DIVISION",
+    "dir": "DIRECTORATE",
+}
+
+def approval_chain_body(snap, npk):
+    """/approval-chain document for ``npk``, or None if it isn't in ``snap``."""
+    chain = snap.approval_chain(npk)
+    if chain is None:
+        return None
+    return {
+        "status": "Success",
+        "NPK": npk,
+        "CHAIN": [
+            {
+                "LEVEL": APPROVAL_LEVEL_NAMES[unit.level],
+                "CODE": unit.code,
+                "NAME": unit.name,
+                "HEADS": [
+                    {
+                        "NPK": row[snapshot.NPK],
+                        "NAME": row[snapshot.NAME],
+                        "EMAIL": row[snapshot.EMAIL],
+                        "ROLE": row[snapshot.JABATAN],
+                    }
+                    for row in heads
+                ],
+            }
+            for unit, heads in chain
+        ],
+    }
+
 def init_routes(app):
     #REGISTER NEW USER TO API
     @app.route("/register", methods=["POST"])
@@ -35,23 +311,90 @@ def init_routes(app):
             password = data["password"].encode("utf-8")
 
             # Hash the password
-            hashed_password = bcrypt.hashpw(password, bcrypt.gensalt())
+            with metrics.timed("bcrypt"):
+                hashed_password = bcrypt.hashpw(password, bcrypt.gensalt())
 
-            conn = get_auth_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO I_User (username, password) VALUES (?, ?)",
-                (username, hashed_password.decode("utf-8")),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with auth_db_connection() as conn:
+                cursor = conn.cursor()
+                queries.execute(cursor, queries.INSERT_USER, (username, hashed_password.decode("utf-8")))
+                conn.commit()
+                cursor.close()
 
             return jsonify({"message": "User registered successfully"}), 201
+        except CircuitOpenError as e:
+            return service_unavailable(e)
         except Exception as e:
             app.logger.error(f"Error in /register: {e}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
     
+# REGISTER USERS IN BULK
+    # Body: {"users": [{"username": "...", "password": "..."}, ...]}; all new users are inserted in one transaction
+    # Unlike /register (self sign-up, one bcrypt hash per call), this needs a token: one call costs up to
+    # REGISTER_BULK_MAX hashes across every bcrypt process, too much to offer anonymously, and creating
+    # accounts for other people is an administrative action
+    @app.route("/register/bulk", methods=["POST"])
+    @token_required
+    def register_bulk():
+        try:
+            data = request.get_json(silent=True) or {}
+            users = data.get("users")
+            if not isinstance(users, list) or not users:
+                return jsonify({"error": "users must be a non-empty list"}), 400
+            if len(users) > REGISTER_BULK_MAX:
+                return jsonify({"error": f"At most {REGISTER_BULK_MAX} users per request"}), 400
+
+            # One result per entry, in request order
+            results = []
+            new_users = {}  # lowercased username -> index in results
+            for user in users:
+                username = user.get("username") if isinstance(user, dict) else None
+                password = user.get("password") if isinstance(user, dict) else None
+                if not isinstance(username, str) or not username or not isinstance(password, str) or not password:
+                    results.append({"username": username, "status": "invalid",
+                                    "error": "username and password must be non-empty strings"})
+                elif username.lower() in new_users:
+                    results.append({"username": username, "status": "conflict",
+                                    "error": "Username repeated in this request"})
+                else:
+                    new_users[username.lower()] = len(results)
+                    results.append({"username": username, "status": "created", "password": password})
+
+            for key in existing_usernames([results[i]["username"] for i in new_users.values()]):
+                index = new_users.pop(key)
+                results[index] = {"username": results[index]["username"], "status": "conflict",
+                                  "error": "Username already exists"}
+
+            to_create = [results[i] for i in new_users.values()]
+            if to_create:
+                with metrics.timed("bcrypt"):
+                    hashed = hashing.hash_passwords([entry.pop("password").encode("utf-8") for entry in to_create])
+                try:
+                    with auth_db_connection() as conn:
+                        cursor = conn.cursor()
+                        cursor.fast_executemany = True
+                        queries.executemany(
+                            cursor,
+                            queries.INSERT_USER,
+                            [(entry["username"], password) for entry, password in zip(to_create, hashed)],
+                        )
+                        conn.commit()
+                        cursor.close()
+                except pyodbc.IntegrityError:
+                    # Another request registered one of the names since the check; nothing was inserted
+                    return jsonify({"error": "A username was registered concurrently, no users were created. Retry the request"}), 409
+
+            return jsonify({
+                "status": "Success",
+                "created": len(to_create),
+                "failed": len(results) - len(to_create),
+                "results": results,
+            })
+        except CircuitOpenError as e:
+            return service_unavailable(e)
+        except Exception as e:
+            app.logger.error(f"Error in /register/bulk: {e}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+
     @app.route("/hello", methods=["POST"])
     def hello():
         return "WELCOME"
@@ -65,37 +408,23 @@ def init_routes(app):
             username = data["username"]
             password = data["password"].encode("utf-8")
 
-            conn = get_auth_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT username, password FROM I_User WHERE username = ?", (username,)
-            )
-            user = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            with auth_db_connection() as conn:
+                cursor = conn.cursor()
+                queries.execute(cursor, queries.USER_CREDENTIALS, (username,))
+                user = cursor.fetchone()
+                cursor.close()
 
             if user:
                 stored_password = user[1].encode("utf-8") 
-                if bcrypt.checkpw(password, stored_password):
-                    # Generate a secure random token using CSPRNG
-                    random_bytes = secrets.token_bytes(32)
-
-                    # Hash the random bytes for added security
-                    token_hash = hashlib.sha256(random_bytes).hexdigest()
-
-                    token = jwt.encode(
-                        {
-                            "user_id": username,
-                            "token_hash": token_hash,
-                            "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1),
-                        },
-                        app.config["SECRET_KEY"],
-                        algorithm="HS256",
-                    )
-
+                # In the login process pool, so a burst of logins can't starve the reads
+                with metrics.timed("bcrypt"):
+                    password_ok = hashing.verify_password(password, stored_password)
+                if password_ok:
                     return jsonify({
                         "status" : "Success",
-                        "token": token})
+                        "token": tokens.issue_access_token(username, app.config["SECRET_KEY"]),
+                        "expires_in": ACCESS_TOKEN_TTL,
+                        "refresh_token": tokens.issue_refresh_token(username, app.config["SECRET_KEY"])})
 
             # Handle invalid login here
             return jsonify({"message": "Invalid username or password"}), 401
@@ -104,43 +433,119 @@ def init_routes(app):
             app.logger.error(f"Error encoding JWT: {e}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
 
+        except hashing.Overloaded as e:
+            response = jsonify({"error": "Too many logins in progress, try again later"})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response
+
+        except CircuitOpenError as e:
+            return service_unavailable(e)
         except Exception as e:
             app.logger.error(f"Error in /login: {e}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
 
+# REFRESH TOKEN: new access token for a refresh token from /login, no password check
+    @app.route("/token/refresh", methods=["POST"])
+    def refresh_token():
+        try:
+            data = request.get_json(silent=True) or {}
+            if not data.get("refresh_token"):
+                return jsonify({"error": "refresh_token is required"}), 400
+            try:
+                claims = tokens.decode_refresh_token(data["refresh_token"], app.config["SECRET_KEY"])
+            except jwt.ExpiredSignatureError:
+                return jsonify({'message': 'Refresh token has expired!'}), 401
+            except tokens.RevokedTokenError:
+                return jsonify({'message': 'Refresh token has been revoked!'}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({'message': 'Invalid refresh token!'}), 401
+
+            return jsonify({
+                "status": "Success",
+                "token": tokens.issue_access_token(claims["user_id"], app.config["SECRET_KEY"]),
+                "expires_in": ACCESS_TOKEN_TTL,
+            })
+        except CircuitOpenError as e:
+            return service_unavailable(e)
+        except Exception as e:
+            app.logger.error(f"Error in /token/refresh: {e}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+
+# REVOKE TOKEN: log a refresh token out before it expires
+    @app.route("/token/revoke", methods=["POST"])
+    def revoke_token():
+        try:
+            data = request.get_json(silent=True) or {}
+            if not data.get("refresh_token"):
+                return jsonify({"error": "refresh_token is required"}), 400
+            try:
+                claims = tokens.decode_refresh_token(data["refresh_token"], app.config["SECRET_KEY"], check_revoked=False)
+            except jwt.ExpiredSignatureError:
+                # Expired tokens are useless already
+                return jsonify({"status": "Success"})
+            except jwt.InvalidTokenError:
+                return jsonify({'message': 'Invalid refresh token!'}), 401
+
+            expires_at = datetime.datetime.utcfromtimestamp(claims["exp"])
+            tokens.revocations.revoke(claims["jti"], claims["user_id"], expires_at)
+            return jsonify({"status": "Success"})
+        except CircuitOpenError as e:
+            return service_unavailable(e)
+        except Exception as e:
+            app.logger.error(f"Error in /token/revoke: {e}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+
 # GET ALL USERS
+    # Optional: ?limit=N&after=<npk> for keyset pagination (ordered by NPK),
+    # ?stream=ndjson|json to stream rows as they are fetched.
     @app.route("/users", methods=["GET"])
     @token_required
     def get_users():
         try:
-            conn = get_info_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-            PUT YOUR QUERY HERE TO GET EMPLOYEE DATA FROM YOUR TABLE 
-            """)
-            rows = cursor.fetchall()
-
-            users = []
-            for row in rows:
-                npk, name, email, jabatan, dir,div,dept = row
-                user_info = {
-                    "NPK": npk,
-                    "NAME": name,
-                    "EMAIL": email,
-                    "ROLE": jabatan,
-                    "Directorat" : dir,
-                    "Division" : div,
-                    "Dept" : dept
-                }
-                users.append(user_info)
-
-            conn.close()
-            
-            return jsonify({
+            after = request.args.get("after", type=int)
+            limit = request.args.get("limit", type=int)
+            stream = request.args.get("stream", "").lower()
+            if "after" in request.args and after is None:
+                return jsonify({"error": "Invalid after parameter"}), 400
+            if "limit" in request.args and (limit is None or not 0 < limit <= USERS_PAGE_MAX):
+                return jsonify({"error": f"limit must be between 1 and {USERS_PAGE_MAX}"}), 400
+            if stream not in ("", "ndjson", "json"):
+                return jsonify({"error": "Invalid stream parameter"}), 400
+
+            # The full list rarely changes, serve it encoded (and compressed) once per snapshot
+            snap = snapshot.current()
+            if snap is not None and after is None and not limit and not stream:
+                return snapshot_response(snap, lambda: snap.memo(("users",), lambda: snapshot_users_payload(snap)))
+
+            query, params = queries.users(after, limit)
+
+            if stream:
+                dumps = app.json.dumps
+                logger = app.logger
+                mimetype = "application/x-ndjson" if stream == "ndjson" else "application/json"
+                cursor, stack = open_users_cursor(query, params)
+                response = Response(stream_users(cursor, stack, stream, limit, dumps, logger), mimetype=mimetype)
+                # In case the body is never iterated (client gone); a no-op once the stream closed it
+                response.call_on_close(stack.close)
+                return response
+
+            rows = queries.fetch_all(info_db_connection, query, params)
+
+            with metrics.timed("build"):
+                users = [user_row_to_dict(row) for row in rows]
+
+            response = {
             "status": "Success",
             "total_users": len(users),
             "users": users
-            })
+            }
+            if limit:
+                # Pass next_after back as ?after= to get the next page
+                response["next_after"] = users[-1]["NPK"] if len(users) == limit else None
+            return jsonify(response)
+        except CircuitOpenError as e:
+            return service_unavailable(e)
         except Exception as e:
             app.logger.error(f"Error in /users: {e}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
@@ -155,122 +560,118 @@ def init_routes(app):
         dptname = request.args.get('dptname')
 
         try:
-            conn = get_info_db_connection()
-            cursor = conn.cursor()
-
-            # Build SQL query dynamically based on the level
-            query = "SELECT distinct "
-            if level == 'dir':
-                query += "dir, dirName, idLokasi "
-            elif level == 'div':
-                query += "dir, dirName, div, div_name, idLokasi "
-            elif level == 'dpt':
-                query += "dir, dirName, div, div_name, dept, deptName, idLokasi "
-            elif level == 'sct':
-                query += "dir, dirName, div, div_name, dept, deptName, sec, idLokasi "
-            elif level == 'subsect':
-                query += "dir, dirName, div, div_name, dept, deptName, sec, subsec, idLokasi "
-            else:
+            if level not in queries.STRUCTURE_COLUMNS:
                 return jsonify({"error": "Invalid level parameter"}), 400
 
-            query += " FROM HRIS_TrAD"
-
-            # Add filtering conditions if provided
-            conditions = []
-            if dirname:
-                conditions.append(f"dir = '{dirname}'")
-            if divname:
-                conditions.append(f"div_name = '{divname}'")
-            if dptname:
-                conditions.append(f"deptName = '{dptname}'")
-
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-
-            cursor.execute(query)
-            rows = cursor.fetchall()
-
-            # Continue processing the results as per your existing logic
-            # Create a nested dictionary to represent the structure
-            structure = {}
-            for row in rows:
-                if level == 'dir':
-                    dir_code, dir_name, lokasi = row
-                    structure.setdefault(dir_code, {}).update({
-                        "DIRNAME": dir_name,
-                        "LOKASI": lokasi,
-                        "DIVISIONS": {}
-                    })
-                elif level == 'div':
-                    dir_code, dir_name, div_code, div_name, lokasi = row
-                    structure.setdefault(dir_code, {}).setdefault("DIVISIONS", {}).setdefault(div_code, {}).update({
-                        "DIVNAME": div_name,
-                        "LOKASI": lokasi,
-                        "DEPARTMENTS": {}
-                    })
-                elif level == 'dpt':
-                    dir_code, dir_name, div_code, div_name, dpt_code, dpt_name, lokasi = row
-                    structure.setdefault(dir_code, {}).setdefault("DIVISIONS", {}).setdefault(div_code, {}).setdefault("DEPARTMENTS", {}).setdefault(dpt_code, {}).update({
-                        "DPTNAME": dpt_name,
-                        "LOKASI": lokasi,
-                        "SECTION": {}
-                    })
-                elif level == 'sct':
-                    dir_code, dir_name, div_code, div_name, dpt_code, dpt_name, sct_name, lokasi = row
-                    structure.setdefault(dir_code, {}).setdefault("DIVISIONS", {}).setdefault(div_code, {}).setdefault("DEPARTMENTS", {}).setdefault(dpt_code, {}).setdefault("SECTION", {}).setdefault(sct_name, {}).update({
-                        "SECNAME": sct_name,
-                        "LOKASI": lokasi,
-                        "SUBSECTION": {}
-                    })
-                elif level == 'subsect':
-                    dir_code, dir_name, div_code, div_name, dpt_code, dpt_name, sct_name, subsect_name, lokasi = row
-                    structure.setdefault(dir_code, {}).setdefault("DIVISIONS", {}).setdefault(div_code, {}).setdefault("DEPARTMENTS", {}).setdefault(dpt_code, {}).setdefault("SECTION", {}).setdefault(sct_name, {}).setdefault("SUBSECTION", {}).setdefault(subsect_name, {}).update({
-                        "SUBSECNAME": subsect_name,
-                        "LOKASI": lokasi
-                    })
-
-            # Convert the nested dictionary to the desired JSON format
-            def format_structure(data, level_key):
-                result = []
-                for code, info in data.items():
-                    item = {level_key: code}
-                    item.update({k: v for k, v in info.items() if not isinstance(v, dict)})
-                    for child_level_key, child_data in info.items():
-                        if isinstance(child_data, dict):
-                            item[child_level_key] = format_structure(child_data, child_level_key[:-1])  # Remove trailing 'S'
-                    result.append(item)
-                return result
-
-            result = format_structure(structure, "DIR")
-            conn.close()
-            return jsonify(result)
+            if any(arg in request.args for arg in ("fields", "depth", "root")):
+                return sparse_structures(level, dirname, divname, dptname)
 
+            levels = tree.STRUCTURE_LEVELS[level]
+
+            # Serve from the in-memory snapshot when it is loaded
+            snap = snapshot.current()
+            if snap is not None:
+                return snapshot_response(snap, lambda: snap.memo(
+                    ("structures", level, dirname, divname, dptname),
+                    lambda: encoding.Payload(tree.tree_json(snap.structure_rows(level, dirname, divname, dptname), levels)),
+                ))
+
+            # One fixed, parameterized statement per level and set of filters given
+            query, params = queries.structures(level, dirname, divname, dptname)
+
+            rows = queries.fetch_all(info_db_connection, query, params)
+
+            # Not streamed: the rows are in memory already, and a plain body gets an ETag (and 304) from conditional_response
+            return Response(tree.tree_json(rows, levels), mimetype="application/json")
+
+        except CircuitOpenError as e:
+            return service_unavailable(e)
         except Exception as e:
             app.logger.error(f"Error in get structures /structures: {e}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
 
+# GET ORG STRUCTURE CHANGES since a snapshot version
+    # ?since=<version> from a previous call or the X-Snapshot-Version header; 410 means do a full resync
+    @app.route("/structures/changes", methods=["GET"])
+    @token_required
+    def get_structure_changes():
+        try:
+            since = request.args.get("since")
+            if not since:
+                return jsonify({"error": "Missing since parameter"}), 400
+
+            snap = snapshot.current()
+            if snap is None:
+                return jsonify({"error": "Org snapshot not loaded yet"}), 503
+
+            changes = snapshot.changes_since(since)
+            if changes is None:
+                return jsonify({
+                    "error": "Unknown or expired version, download /structures and /users again",
+                    "version": snap.version,
+                }), 410
+
+            return jsonify({
+                "status": "Success",
+                "since": since,
+                # Newest version in the (shared) history, which this worker may not have mapped yet
+                "version": changes[-1]["version"] if changes else since,
+                "changes": changes,
+            })
+        except Exception as e:
+            app.logger.error(f"Error in /structures/changes: {e}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+
+# EXPORT the whole org snapshot (units and employees tables) as one zip file
+    # ?format=parquet|csv, parquet by default when pyarrow is installed; supports Range requests
+    @app.route("/export/snapshot", methods=["GET"])
+    @token_required
+    def export_snapshot():
+        try:
+            fmt = request.args.get("format", export.FORMATS[0]).lower()
+            if fmt not in export.ALL_FORMATS:
+                return jsonify({"error": "Invalid format parameter"}), 400
+            if fmt not in export.FORMATS:
+                return jsonify({"error": f"{fmt} export is not available, use one of: {', '.join(export.FORMATS)}"}), 406
+
+            snap = snapshot.current()
+            if snap is None:
+                return jsonify({"error": "Org snapshot not loaded yet"}), 503
+
+            path = export.ensure(snap, fmt)
+
+            # Sent straight from the file (wsgi.file_wrapper), with 206/304 handled by send_file
+            response = send_file(
+                path, mimetype="application/zip", as_attachment=True,
+                download_name=export.file_name(snap, fmt), etag=f"{snap.version}-{fmt}", conditional=True,
+            )
+            response.headers["X-Snapshot-Version"] = snap.version
+            if CACHE_CONTROL:
+                response.headers["Cache-Control"] = CACHE_CONTROL
+            return response
+        except Exception as e:
+            app.logger.error(f"Error in /export/snapshot: {e}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+
 # GET USER by NPK
     @app.route("/users/npk/<int:user_id>", methods=["GET"])
     @token_required
     def get_user_npk(user_id):
         try:
-            conn = get_info_db_connection()
-            cursor = conn.cursor()
-
-            # Execute the SQL query to fetch the user by NPK
-            cursor.execute("PUT YOUR QUERY HERE TO GET EMPLOYEE DATA FROM YOUR TABLE WHERE npk = ?",(user_id,),)
-            row = cursor.fetchone()
+            # Fetch the user by NPK
+            rows = queries.fetch_all(info_db_connection, queries.USER_BY_NPK, (user_id,))
+            row = rows[0] if rows else None
 
             # Check if the user was found
             if row:
                 npk, name, email, jabatan = row
                 user_info = {"NPK": npk, "NAME": name, "EMAIL": email, "ROLE": jabatan}
-                conn.close()
                 return jsonify(user_info)
             else:
-                conn.close()
                 return jsonify({"error": "User not found"}), 404
 
+        except CircuitOpenError as e:
+            return service_unavailable(e)
         except Exception as e:
             app.logger.error(f"Error in /users/npk/{user_id}: {e}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
@@ -280,15 +681,9 @@ def init_routes(app):
     @token_required
     def get_username(username):
         try:
-            conn = get_info_db_connection()
-            cursor = conn.cursor()
-
-            # Execute the SQL query to fetch the user by NPK
-            cursor.execute(
-                "SELECT npk, username, name, email, jabatan FROM HRIS_TrAD WHERE username = ?",
-                (username,),
-            )
-            row = cursor.fetchone()
+            # Fetch the user by username
+            rows = queries.fetch_all(info_db_connection, queries.USER_BY_USERNAME, (username,))
+            row = rows[0] if rows else None
 
             # Check if the user was found
             if row:
@@ -300,111 +695,106 @@ def init_routes(app):
                     "EMAIL": email,
                     "ROLE": jabatan,
                 }
-                conn.close()
                 return jsonify(user_info)
             else:
-                conn.close()
                 return jsonify({"error": "User not found"}), 404
 
+        except CircuitOpenError as e:
+            return service_unavailable(e)
         except Exception as e:
             app.logger.error(f"Error in /users/username/{username}: {e}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
 
+# GET USERS in BATCH by NPK and/or USERNAME
+    # Body: {"npks": [123, ...], "usernames": ["name", ...]}
+    @app.route("/users/batch", methods=["POST"])
+    @token_required
+    def get_users_batch():
+        try:
+            data = request.get_json(silent=True) or {}
+            npks = data.get("npks") or []
+            usernames = data.get("usernames") or []
+            if not isinstance(npks, list) or not isinstance(usernames, list):
+                return jsonify({"error": "npks and usernames must be lists"}), 400
+            if len(npks) + len(usernames) > BATCH_LOOKUP_MAX:
+                return jsonify({"error": f"At most {BATCH_LOOKUP_MAX} identifiers per request"}), 400
+            # JSON integers only: int() would turn 1.7 or true into NPK 1 and look up the wrong employee
+            invalid = [npk for npk in npks if type(npk) is not int]
+            if invalid:
+                return jsonify({"error": "npks must be integers", "invalid": invalid}), 400
+            if not all(isinstance(username, str) for username in usernames):
+                return jsonify({"error": "usernames must be strings"}), 400
+
+            by_npk, by_username = lookup_users(npks, usernames)
+
+            # Every requested identifier gets an entry, null when not found
+            npk_result = {str(npk): by_npk.get(npk) for npk in npks}
+            username_result = {username: by_username.get(username.lower()) for username in usernames}
+            return jsonify({
+                "status": "Success",
+                "npks": npk_result,
+                "usernames": username_result,
+                "not_found": {
+                    "npks": [npk for npk, user in npk_result.items() if user is None],
+                    "usernames": [username for username, user in username_result.items() if user is None],
+                },
+            })
+        except CircuitOpenError as e:
+            return service_unavailable(e)
+        except Exception as e:
+            app.logger.error(f"Error in /users/batch: {e}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+
+# SEARCH USERS by NPK, name, username or email (people picker)
+    # ?q=<text>&limit=N; every word of q must match the start, or part, of a field, small typos are tolerated
+    @app.route("/users/search", methods=["GET"])
+    @token_required
+    def search_users():
+        try:
+            q = request.args.get("q", "").strip()
+            limit = request.args.get("limit", SEARCH_DEFAULT_LIMIT, type=int)
+            if not q:
+                return jsonify({"error": "Missing q parameter"}), 400
+            if limit is None or not 0 < limit <= SEARCH_MAX_LIMIT:
+                return jsonify({"error": f"limit must be between 1 and {SEARCH_MAX_LIMIT}"}), 400
+
+            snap = snapshot.current()
+            if snap is None:
+                total, users = search_users_db(q, limit)
+                return jsonify({"status": "Success", "query": q, "total": total, "users": users})
+
+            def build():
+                columns = (snapshot.NPK, snapshot.USERNAME, snapshot.NAME, snapshot.EMAIL, snapshot.JABATAN)
+                total, matches = snap.search_index().search(q, limit)
+                users = [
+                    dict(batch_user_info(*(row[c] for c in columns)), SCORE=round(score, 3))
+                    for row, score in matches
+                ]
+                return encoding.Payload(encoding.dumps_bytes({"status": "Success", "query": q, "total": total, "users": users}))
+
+            return snapshot_response(snap, build)
+        except CircuitOpenError as e:
+            return service_unavailable(e)
+        except Exception as e:
+            app.logger.error(f"Error in /users/search: {e}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+
 # GET STRUCTURES by DIR
     @app.route("/structures/dir/<string:dir_id>", methods=["GET"])
     @token_required
     def get_structures_by_dir(dir_id):
         try:
-            conn = get_info_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("PUT YOUR QUERY HERE TO GET EMPLOYEE DATA FROM YOUR TABLE Where dir = ?",(dir_id,),)
-            rows = cursor.fetchall()
-
-            # Organize the data into a hierarchical structure
-            structure = {}
-            for row in rows:
-                (
-                    dir_code,
-                    dir_name,
-                    div_code,
-                    div_name,
-                    dept_code,
-                    dept_name,
-                    npk,
-                    name,
-                    email,
-                    jabatan,
-                ) = row
-
-                # Ensure the directorate exists in the structure
-                if dir_code not in structure:
-                    structure[dir_code] = {
-                        "DIRNAME": dir_name,
-                        "DIVISIONS": {},
-                        "DIRHEAD": [],
-                    }
-
-                # Ensure the division exists under the directorate
-                if div_code not in structure[dir_code]["DIVISIONS"]:
-                    structure[dir_code]["DIVISIONS"][div_code] = {
-                        "DIVNAME": div_name,
-                        "DEPARTMENTS": {},
-                        "DIVHEAD": [],
-                    }
-
-                # Add the department under the division
-                if (
-                    dept_code
-                    not in structure[dir_code]["DIVISIONS"][div_code]["DEPARTMENTS"]
-                ):
-                    structure[dir_code]["DIVISIONS"][div_code]["DEPARTMENTS"][
-                        dept_code
-                    ] = {"DPTNAME": dept_name, "DPTHEAD": []}
-
-                person_info = {
-                    "NPK": npk,
-                    "NAME": name,
-                    "EMAIL": email,
-                    "ROLE": jabatan,
-                }
-
-                if jabatan and "director" in jabatan.lower():
-                    structure[dir_code]["DIRHEAD"].append(person_info)
+            snap = snapshot.current()
+            if snap is not None:
+                return snapshot_response(snap, lambda: snap.memo(
+                    ("dir", dir_id), lambda: encoding.Payload(tree.tree_json(snap.dir_rows(dir_id), tree.DIR_LEVELS))
+                ))
 
-                if jabatan and "division head" in jabatan.lower():
-                    structure[dir_code]["DIVISIONS"][div_code]["DIVHEAD"].append(person_info)
-
-                if jabatan and "department head" in jabatan.lower():
-                    structure[dir_code]["DIVISIONS"][div_code]["DEPARTMENTS"][dept_code]["DPTHEAD"].append(person_info)
-
-            # Convert structure to the desired JSON format
-            result = []
-            for dir_code, dir_data in structure.items():
-                dir_info = {
-                    "DIR": dir_code,
-                    "DIRNAME": dir_data["DIRNAME"],
-                    "DIRHEAD": dir_data["DIRHEAD"],
-                    "DIVISIONS": [],
-                }
-                for div_code, div_data in dir_data["DIVISIONS"].items():
-                    div_info = {
-                        "DIV": div_code,
-                        "DIVNAME": div_data["DIVNAME"],
-                        "DIVHEAD": div_data["DIVHEAD"],
-                        "DEPARTMENTS": [
-                            {
-                                "DPT": dept_code,
-                                "DPTNAME": dept_data["DPTNAME"],
-                                "DPTHEAD": dept_data["DPTHEAD"],
-                            }
-                            for dept_code, dept_data in div_data["DEPARTMENTS"].items()
-                        ],
-                    }
-                    dir_info["DIVISIONS"].append(div_info)
-                result.append(dir_info)
+            rows = queries.fetch_all(info_db_connection, queries.STRUCTURES_BY_DIR, (dir_id,))
 
-            conn.close()
-            return jsonify(result)
+            return Response(tree.tree_json(rows, tree.DIR_LEVELS), mimetype="application/json")
+        except CircuitOpenError as e:
+            return service_unavailable(e)
         except Exception as e:
             app.logger.error(f"Error in /structures/dir/{dir_id}: {e}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
@@ -414,80 +804,74 @@ def init_routes(app):
     @token_required
     def get_structures_by_div(div_id):
         try:
-            conn = get_info_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "PUT YOUR QUERY HERE TO GET EMPLOYEE DATA FROM YOUR TABLE WHERE div = ?",
-                (div_id,),
-            )
-            rows = cursor.fetchall()
-
-            # Organize the data into a hierarchical structure
-            structure = {}
-            for row in rows:
-                (
-                    div_code,
-                    div_name,
-                    dept_code,
-                    dept_name,
-                    npk,
-                    name,
-                    email,
-                    jabatan,
-                ) = row
-
-                # Ensure the division exists in the structure
-                if div_code not in structure:
-                    structure[div_code] = {
-                        "DIVNAME": div_name,
-                        "DEPARTMENTS": {},
-                        "DIVHEAD": [],
-                    }
+            snap = snapshot.current()
+            if snap is not None:
+                return snapshot_response(snap, lambda: snap.memo(
+                    ("div", div_id), lambda: encoding.Payload(tree.tree_json(snap.div_rows(div_id), tree.DIV_LEVELS))
+                ))
 
-                # Add the department under the division
-                if dept_code not in structure[div_code]["DEPARTMENTS"]:
-                    structure[div_code]["DEPARTMENTS"][dept_code] = {
-                        "DPTNAME": dept_name,
-                        "DPTHEAD": [],
-                    }
+            rows = queries.fetch_all(info_db_connection, queries.STRUCTURES_BY_DIV, (div_id,))
 
-                # Add the person to the division or department if their job title contains "head"
-                person_info = {
-                    "NPK": npk,
-                    "NAME": name,
-                    "EMAIL": email,
-                    "JABATAN": jabatan,
-                }
-
-                if "division head" in jabatan.lower():
-                    structure[div_code]["DIVHEAD"].append(person_info)
-
-                if "department head" in jabatan.lower():
-                    structure[div_code]["DEPARTMENTS"][dept_code]["DPTHEAD"].append(
-                        person_info
-                    )
-
-            # Convert structure to the desired JSON format
-            result = []
-            for div_code, div_data in structure.items():
-                div_info = {
-                    "DIV": div_code,
-                    "DIVNAME": div_data["DIVNAME"],
-                    "DIVHEAD": div_data["DIVHEAD"],
-                    "DEPARTMENTS": [
-                        {
-                            "DPT": dept_code,
-                            "DPTNAME": dept_data["DPTNAME"],
-                            "DPTHEAD": dept_data["DPTHEAD"],
-                        }
-                        for dept_code, dept_data in div_data["DEPARTMENTS"].items()
-                    ],
-                }
-                result.append(div_info)
-
-            conn.close()
-            return jsonify(result)
+            return Response(tree.tree_json(rows, tree.DIV_LEVELS), mimetype="application/json")
+        except CircuitOpenError as e:
+            return service_unavailable(e)
         except Exception as e:
             app.logger.error(f"Error in /structures/div/{div_id}: {e}", exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
 
+# GET APPROVAL CHAIN of an employee, nearest head first
+    @app.route("/approval-chain/<int:npk>", methods=["GET"])
+    @token_required
+    def get_approval_chain(npk):
+        try:
+            snap = snapshot.current()
+            if snap is not None:
+                if npk not in snap.unit_by_npk:
+                    return jsonify({"error": "User not found"}), 404
+                return snapshot_response(snap, lambda: encoding.Payload(encoding.dumps_bytes(approval_chain_body(snap, npk))))
+
+            body = approval_chain_body(snapshot.load_directorate_of(npk), npk)
+            if body is None:
+                return jsonify({"error": "User not found"}), 404
+            return jsonify(body)
+        except CircuitOpenError as e:
+            return service_unavailable(e)
+        except Exception as e:
+            app.logger.error(f"Error in /approval-chain/{npk}: {e}", exc_info=True)
+            return jsonify({"error": "Internal server error"}), 500
+
+# READINESS, for IIS Application Initialization / load balancer checks
+    @app.route("/ready", methods=["GET"])
+    def ready():
+        report = app.extensions.get("startup_report")
+        if report is None or not report.ready:
+            return jsonify({"status": "Starting"}), 503
+        return jsonify({"status": "Ready", "startup": report.as_dict()})
+
+# PROMETHEUS METRICS
+    @app.route("/metrics", methods=["GET"])
+    @metrics_token_required
+    def get_metrics():
+        return Response(
+            metrics.render(get_pool_stats(), app.extensions.get("startup_report")),
+            mimetype="text/plain; version=0.0.4",
+        )
+
+# SQL STATEMENT STATS
+    @app.route("/queries/stats", methods=["GET"])
+    @token_required
+    def query_stats():
+        return jsonify({
+            "status": "Success",
+            "statements": queries.stats()
+        })
+
+# DB CONNECTION POOL STATS
+    @app.route("/pool/stats", methods=["GET"])
+    @token_required
+    def pool_stats():
+        return jsonify({
+            "status": "Success",
+            "pools": get_pool_stats(),
+            "bcrypt_login": hashing.login_stats(),
+        })
@@ -0,0 +1,180 @@
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from collections.abc import Sequence
+from config import SEARCH_FUZZY_MIN_SIMILARITY
+
+# Score of the best way a query term matched an employee
+EXACT = 4.0
+PREFIX = 3.0
+SUBSTRING = 2.0
+FUZZY = 1.0   # scaled by the trigram similarity
+
+_SPLIT = re.compile(r"[\W_]+")
+
+# Greater than any character, closes the bisect range of a prefix
+_PREFIX_END = "\U0010ffff"
+
+
+def terms(text):
+    """Lowercased words of ``text``, splitting on anything not a letter or digit."""
+    return [t for t in _SPLIT.split(str(text).lower()) if t]
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _padded_trigrams(token):
+    # Padding gives short words trigrams and weighs word starts and ends
+    return trigrams(f"  {token} ")
+
+
+class _Strings(Sequence):
+    """Strings stored as one str and their offsets: no object per string, and bisect still works."""
+
+    def __init__(self, strings):
+        self.text = "".join(strings)
+        self.offsets = array("I", [0])
+        end = 0
+        for string in strings:
+            end += len(string)
+            self.offsets.append(end)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+
+class SearchIndex:
+    """Prefix, substring and typo-tolerant lookup of employees.
+
+    Every value of the indexed columns is lowercased and stored whole and
+    split into words. The distinct tokens are kept sorted, so a prefix is a
+    bisect range, and a trigram -> tokens map finds substrings and near
+    misses without scanning the vocabulary. Each query term must match
+    every returned employee; results are ranked by how well they matched,
+    ties by ``sort_key(row)`` (position in ``rows`` if not given).
+
+    Tokens, postings and trigram lists are flat arrays rather than Python
+    objects per entry, which keeps the index a fraction of its dict size.
+    """
+
+    def __init__(self, rows, columns, sort_key=None):
+        self.rows = rows
+        # Tie-break rank of each row, so ranking never has to decode rows
+        if sort_key is None:
+            self._rank = array("I", range(len(rows)))
+        else:
+            self._rank = array("I", bytes(4 * len(rows)))
+            for rank, doc in enumerate(sorted(range(len(rows)), key=lambda doc: sort_key(rows[doc]))):
+                self._rank[doc] = rank
+
+        # token -> doc, or array of docs once it is in more than one
+        tokens = {}
+        for doc, row in enumerate(rows):
+            for column in columns:
+                value = row[column]
+                if value is None or value == "":
+                    continue
+                value = str(value).lower()
+                for token in [value] + terms(value):
+                    docs = tokens.get(token)
+                    if docs is None:
+                        tokens[token] = doc
+                    elif type(docs) is int:
+                        if docs != doc:
+                            tokens[token] = array("I", (docs, doc))
+                    elif docs[-1] != doc:
+                        docs.append(doc)
+
+        sorted_tokens = sorted(tokens)
+        # Docs of token i are _docs[_doc_offsets[i]:_doc_offsets[i + 1]], in row order
+        self._docs = array("I")
+        self._doc_offsets = array("I", [0])
+        for token in sorted_tokens:
+            docs = tokens.pop(token)
+            if type(docs) is int:
+                self._docs.append(docs)
+            else:
+                self._docs.extend(docs)
+            self._doc_offsets.append(len(self._docs))
+        self._tokens = _Strings(sorted_tokens)
+
+        self._gram_counts = array("H")
+        self._grams = {}
+        for token_id, token in enumerate(sorted_tokens):
+            grams = _padded_trigrams(token)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                token_ids = self._grams.get(gram)
+                if token_ids is None:
+                    token_ids = self._grams[gram] = array("I")
+                token_ids.append(token_id)
+
+    def _postings(self, token_id):
+        return self._docs[self._doc_offsets[token_id]:self._doc_offsets[token_id + 1]]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _term_scores(self, term):
+        """{doc: best score} of the employees matching one query term."""
+        lo = bisect_left(self._tokens, term)
+        hi = bisect_left(self._tokens, term + _PREFIX_END, lo)
+        exact = [lo] if lo < hi and self._tokens[lo] == term else []
+        # Prefix matches are consecutive tokens, so their docs are one slice
+        prefix = self._docs[self._doc_offsets[lo + len(exact)]:self._doc_offsets[hi]]
+        substring = []
+        if len(term) >= 3:
+            postings = sorted((self._grams.get(gram, ()) for gram in trigrams(term)), key=len)
+            if postings[0]:
+                text, ends = self._tokens.text, self._tokens.offsets
+                substring = [t for t in set(postings[0]).intersection(*postings[1:])
+                             if text.find(term, ends[t], ends[t + 1]) >= 0]
+
+        # Weakest match first, so each employee ends up with its best score.
+        # dict.update keeps this out of Python code: "a" can match every row.
+        scores = {}
+        docs, starts = self._docs, self._doc_offsets
+        scores.update(dict.fromkeys([doc for t in substring for doc in docs[starts[t]:starts[t + 1]]], SUBSTRING))
+        scores.update(dict.fromkeys(prefix, PREFIX))
+        if exact:
+            scores.update(dict.fromkeys(self._postings(lo), EXACT))
+        if scores or len(term) < 3:
+            return scores
+
+        # No literal match, look for tokens sharing most of the trigrams (typos)
+        grams = _padded_trigrams(term)
+        shared = {}
+        for gram in grams:
+            for token_id in self._grams.get(gram, ()):
+                shared[token_id] = shared.get(token_id, 0) + 1
+        for token_id, count in shared.items():
+            similarity = 2 * count / (len(grams) + self._gram_counts[token_id])
+            if similarity < SEARCH_FUZZY_MIN_SIMILARITY:
+                continue
+            score = FUZZY * similarity
+            for doc in self._postings(token_id):
+                if scores.get(doc, 0.0) < score:
+                    scores[doc] = score
+        return scores
+
+    def search(self, query, limit):
+        """Best ``limit`` matches of ``query`` as (total matches, [(row, score), ...])."""
+        query_terms = list(dict.fromkeys(terms(query)))
+        if not query_terms:
+            return 0, []
+
+        # Most selective term first, so the intersection shrinks quickly
+        per_term = sorted((self._term_scores(term) for term in query_terms), key=len)
+        scores = dict(per_term[0])
+        for term_scores in per_term[1:]:
+            scores = {doc: score + term_scores[doc] for doc, score in scores.items() if doc in term_scores}
+            if not scores:
+                break
+
+        rank = self._rank
+        best = heapq.nsmallest(limit, scores, key=lambda doc: (-scores[doc], rank[doc]))
+        return len(scores), [(self.rows[doc], scores[doc]) for doc in best]
@@ -0,0 +1,54 @@
+import threading
+from app import metrics
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse identical concurrent calls into one.
+
+    The first caller for a key runs the loader; callers arriving with the
+    same key while it runs wait and get the same result (or exception).
+    Nothing is cached: once the call finishes the next caller runs it again.
+    Results are shared between threads, so they must not be mutated.
+    """
+
+    def __init__(self, group):
+        self.group = group
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, load, label=None):
+        label = label or self.group
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.SINGLEFLIGHT_CALLS.inc(self.group, label, "coalesced")
+            with metrics.timed("coalesced_wait"):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.SINGLEFLIGHT_CALLS.inc(self.group, label, "executed")
+        try:
+            call.result = load()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
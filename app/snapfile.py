@@ -0,0 +1,272 @@
+# Binary image of the org snapshot that worker processes share through mmap.
+#
+# Layout (native byte order, sections 8-byte aligned):
+#
+#   header      magic, version, loaded_at, counts and section offsets
+#   values      uint32 offsets + blob of every distinct cell value, each a
+#               tag byte (s = str, i = int) followed by its UTF-8 text
+#   cells       uint32 value refs, COLUMNS per employee, in snapshot order
+#   row_unit    uint32 unit of each employee (its deepest unit)
+#   row_head    uint32 unit each employee heads, or NONE
+#   units       UNIT_FIELDS uint32 per unit: level, code, name, lokasi, parent
+#   npk_keys    int64 NPKs sorted, with npk_rows: uint32 row of each
+#   user_rows   uint32 rows sorted by lowercased username
+#
+# NPKs and usernames are unique in the indexes (the last row wins).
+#
+# Refs equal to NONE stand for NULL. One worker writes a new file per
+# version and swaps the "current" pointer file to it; every worker maps
+# the file read-only, so the data is in RAM once however many workers run.
+# The same worker keeps the version history for /structures/changes in
+# history.json beside it, so every worker answers from the same one.
+import decimal
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b"ORGSNAP1"
+NONE = 0xFFFFFFFF
+COLUMNS = 14
+UNIT_FIELDS = 5
+
+_STR, _INT = ord("s"), ord("i")
+
+# magic, version, loaded_at, byte order, n_values, n_rows, n_units, n_npks, n_users, 9 section offsets
+_HEADER = struct.Struct("<8s40sd8sIIIII9Q")
+_SECTIONS = ("value_offsets", "values", "cells", "row_unit", "row_head", "units", "npk_keys", "npk_rows", "user_rows")
+
+POINTER_NAME = "current"
+HISTORY_NAME = "history.json"
+LOCK_NAME = "refresher.lock"
+FILE_PREFIX = "org-snapshot-"
+
+
+def normalize(value):
+    """The value as stored: integral numbers become int."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, decimal.Decimal) and value == value.to_integral_value():
+        return int(value)
+    return value
+
+def encode(rows, version, loaded_at, units, row_unit, row_head, npk_column, username_column):
+    """The file contents for ``rows`` (tuples of COLUMNS values).
+
+    ``units`` are (level, code, name, lokasi, parent index or NONE) tuples,
+    ``row_unit``/``row_head`` unit indexes per row. Values other than str
+    and int are stored as their str().
+    """
+    refs = {}
+    offsets = array("I", [0])
+    blob = bytearray()
+
+    def ref(value):
+        if value is None:
+            return NONE
+        value = normalize(value)
+        key = (_INT, str(value)) if isinstance(value, int) else (_STR, str(value))
+        index = refs.get(key)
+        if index is None:
+            index = refs[key] = len(refs)
+            blob.append(key[0])
+            blob.extend(key[1].encode("utf-8"))
+            offsets.append(len(blob))
+        return index
+
+    cells = array("I", (ref(value) for row in rows for value in row))
+    unit_table = array("I")
+    for level, code, name, lokasi, parent in units:
+        unit_table.extend((level, ref(code), ref(name), ref(lokasi), parent))
+
+    # Later rows win on duplicate keys, as they did in the dicts this replaces
+    npks = {}
+    users = {}
+    for i, row in enumerate(rows):
+        npk = normalize(row[npk_column])
+        if isinstance(npk, int):
+            npks[npk] = i
+        if row[username_column]:
+            users[str(row[username_column]).lower()] = i
+    npks = sorted(npks.items())
+    users = [i for _, i in sorted(users.items())]
+
+    sections = [
+        offsets.tobytes(),
+        bytes(blob),
+        cells.tobytes(),
+        array("I", row_unit).tobytes(),
+        array("I", row_head).tobytes(),
+        unit_table.tobytes(),
+        array("q", (npk for npk, _ in npks)).tobytes(),
+        array("I", (i for _, i in npks)).tobytes(),
+        array("I", users).tobytes(),
+    ]
+    positions = []
+    position = _HEADER.size
+    for data in sections:
+        position += -position % 8
+        positions.append(position)
+        position += len(data)
+
+    out = bytearray(position)
+    _HEADER.pack_into(
+        out, 0, MAGIC, version.encode("ascii"), loaded_at, sys.byteorder.encode("ascii").ljust(8),
+        len(refs), len(rows), len(units), len(npks), len(users), *positions,
+    )
+    for start, data in zip(positions, sections):
+        out[start:start + len(data)] = data
+    return bytes(out)
+
+
+class Image:
+    """Read-only view of an encoded snapshot in ``buffer`` (bytes or mmap)."""
+
+    def __init__(self, buffer):
+        (magic, version, loaded_at, byteorder, n_values, n_rows, n_units, n_npks, n_users,
+         *positions) = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not an org snapshot file")
+        if byteorder.rstrip() != sys.byteorder.encode("ascii"):
+            raise ValueError("Org snapshot file was written on a machine with another byte order")
+        self.version = version.decode("ascii")
+        self.loaded_at = loaded_at
+        self.n_rows = n_rows
+        self.n_units = n_units
+        self._buffer = buffer
+
+        view = memoryview(buffer)
+        at = dict(zip(_SECTIONS, positions))
+        self._offsets = view[at["value_offsets"]:at["value_offsets"] + (n_values + 1) * 4].cast("I")
+        self._values = view[at["values"]:at["values"] + self._offsets[n_values]]
+        self.cells = view[at["cells"]:at["cells"] + n_rows * COLUMNS * 4].cast("I")
+        self.row_unit = view[at["row_unit"]:at["row_unit"] + n_rows * 4].cast("I")
+        self.row_head = view[at["row_head"]:at["row_head"] + n_rows * 4].cast("I")
+        self.units = view[at["units"]:at["units"] + n_units * UNIT_FIELDS * 4].cast("I")
+        self.npk_keys = view[at["npk_keys"]:at["npk_keys"] + n_npks * 8].cast("q")
+        self.npk_rows = view[at["npk_rows"]:at["npk_rows"] + n_npks * 4].cast("I")
+        self.user_rows = view[at["user_rows"]:at["user_rows"] + n_users * 4].cast("I")
+
+    def value(self, ref):
+        if ref == NONE:
+            return None
+        start, end = self._offsets[ref], self._offsets[ref + 1]
+        text = str(self._values[start + 1:end], "utf-8")
+        return int(text) if self._values[start] == _INT else text
+
+    def row_refs(self, i):
+        return self.cells[i * COLUMNS:(i + 1) * COLUMNS].tolist()
+
+    def row(self, i):
+        value = self.value
+        return tuple([value(ref) for ref in self.row_refs(i)])
+
+    def column_refs(self, column):
+        """Value refs of one column for every row."""
+        return self.cells[column::COLUMNS].tolist()
+
+    def unit(self, i):
+        return self.units[i * UNIT_FIELDS:(i + 1) * UNIT_FIELDS].tolist()
+
+
+def _write_atomic(path, data):
+    # Readers see the old or the new contents, never a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def write_file(directory, data, version):
+    """Write ``data`` as the file of ``version``. Returns the file name; ``publish`` makes it current.
+
+    Files are never rewritten in place because other workers may have them mapped.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"{FILE_PREFIX}{version}.bin"
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    return name
+
+def publish(directory, name):
+    """Point ``current`` at the file ``name``, for the other workers to map."""
+    _write_atomic(os.path.join(directory, POINTER_NAME), name.encode("ascii"))
+
+def write_history(directory, entries):
+    """Save the version history (a JSON-able list) next to the snapshot files."""
+    _write_atomic(os.path.join(directory, HISTORY_NAME), json.dumps(entries).encode("utf-8"))
+
+def read_history(directory, stamp=None):
+    """(entries, stamp) of the saved version history, or (None, stamp) if absent or still ``stamp``."""
+    path = os.path.join(directory, HISTORY_NAME)
+    try:
+        stat = os.stat(path)
+        new_stamp = (stat.st_mtime_ns, stat.st_size)
+        if new_stamp == stamp:
+            return None, stamp
+        with open(path, "rb") as f:
+            return json.load(f), new_stamp
+    except FileNotFoundError:
+        return None, stamp
+
+def current_name(directory):
+    """File name ``current`` points at, or None before the first publish."""
+    try:
+        with open(os.path.join(directory, POINTER_NAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def open_image(directory, name):
+    """Map a published snapshot file read-only."""
+    with open(os.path.join(directory, name), "rb") as f:
+        # The mapping stays valid after the file is closed
+        return Image(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def remove_old_files(directory, keep):
+    """Delete snapshot files not named in ``keep``. Files still mapped by a worker (Windows) are left for next time."""
+    for name in os.listdir(directory):
+        if name.startswith(FILE_PREFIX) and name not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+class RefresherLock:
+    """Non-blocking, process-wide lock electing the worker that refreshes from the DB.
+
+    Held until the process exits, then the OS releases it and another
+    worker takes over on its next attempt.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, LOCK_NAME)
+        self._file = None
+
+    @property
+    def held(self):
+        return self._file is not None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path, "a+b")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
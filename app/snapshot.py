@@ -0,0 +1,671 @@
+import hashlib
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from collections.abc import Mapping, Sequence
+from app import queries, snapfile
+from app import breaker
+from app.models import info_db_connection, info_pool
+from app.singleflight import SingleFlight
+from app.search import SearchIndex
+from config import (SNAPSHOT_ENABLED, SNAPSHOT_REFRESH_INTERVAL, SNAPSHOT_MEMO_SIZE, SNAPSHOT_HISTORY,
+                    SNAPSHOT_SHARED_DIR, SNAPSHOT_SHARED_POLL)
+
+# Columns of queries.SNAPSHOT rows
+(DIR, DIRNAME, DIV, DIVNAME, DEPT, DEPTNAME, SEC, SUBSEC, LOKASI,
+ NPK, USERNAME, NAME, EMAIL, JABATAN) = range(14)
+
+# Column of each HRIS_TrAD column name in those rows
+SQL_COLUMNS = {
+    name: column for column, name in enumerate((
+        "dir", "dirName", "div", "div_name", "dept", "deptName", "sec", "subsec", "idLokasi",
+        "npk", "username", "name", "email", "jabatan",
+    ))
+}
+
+LEVELS = ("dir", "div", "dpt", "sct", "subsect")
+
+# Columns selected by /structures for each level (same order as the SQL it replaces)
+LEVEL_COLUMNS = {
+    "dir": (DIR, DIRNAME, LOKASI),
+    "div": (DIR, DIRNAME, DIV, DIVNAME, LOKASI),
+    "dpt": (DIR, DIRNAME, DIV, DIVNAME, DEPT, DEPTNAME, LOKASI),
+    "sct": (DIR, DIRNAME, DIV, DIVNAME, DEPT, DEPTNAME, SEC, LOKASI),
+    "subsect": (DIR, DIRNAME, DIV, DIVNAME, DEPT, DEPTNAME, SEC, SUBSEC, LOKASI),
+}
+
+# (code column, name column) of each level. Sections have no separate code.
+LEVEL_KEYS = {
+    "dir": (DIR, DIRNAME),
+    "div": (DIV, DIVNAME),
+    "dpt": (DEPT, DEPTNAME),
+    "sct": (SEC, SEC),
+    "subsect": (SUBSEC, SUBSEC),
+}
+
+# jabatan keywords that make someone head of the unit at a level. Checked in
+# order, so "subsection head" wins over the "section head" it contains.
+HEAD_TITLES = (
+    ("subsect", "subsection head"),
+    ("subsect", "sub section head"),
+    ("sct", "section head"),
+    ("dpt", "department head"),
+    ("div", "division head"),
+    ("dir", "director"),
+)
+
+def head_level(jabatan):
+    """The level a job title heads, or None if it is not a head position."""
+    if not jabatan:
+        return None
+    jabatan = jabatan.lower()
+    for level, title in HEAD_TITLES:
+        if title in jabatan:
+            return level
+    return None
+
+
+class Unit:
+    __slots__ = ("level", "code", "name", "lokasi", "parent", "children", "heads")
+
+    def __init__(self, level, code, name, lokasi, parent):
+        self.level = level
+        self.code = code
+        self.name = name
+        self.lokasi = lokasi
+        self.parent = parent
+        self.children = {}
+        self.heads = []
+
+
+def unit_path(unit):
+    """Codes from the directorate down to ``unit``."""
+    path = []
+    while unit is not None:
+        path.append(unit.code)
+        unit = unit.parent
+    return path[::-1]
+
+def unit_key(unit):
+    """Identity of a unit across snapshots.
+
+    Sections and subsections have no code of their own, so they are only
+    the same unit under the same parent.
+    """
+    if unit.level in ("sct", "subsect"):
+        return (unit.level, tuple(unit_path(unit)))
+    return (unit.level, unit.code)
+
+
+def rows_version(rows):
+    """sha1 of ``repr(rows)``, hashed a row at a time so the table is never one big string."""
+    digest = hashlib.sha1(b"[")
+    for index, row in enumerate(rows):
+        if index:
+            digest.update(b", ")
+        digest.update(repr(row).encode("utf-8"))
+    digest.update(b"]")
+    return digest.hexdigest()
+
+def _layout(rows):
+    """Units of the org tree as snapfile tuples, and the unit each row is in and heads."""
+    units = []
+    children = []
+    roots = {}
+    row_unit = []
+    row_head = []
+    for row in rows:
+        level_children = roots
+        parent = snapfile.NONE
+        path = {}
+        for depth, level in enumerate(LEVELS):
+            code_col, name_col = LEVEL_KEYS[level]
+            code = row[code_col]
+            if code is None or code == "":
+                # Heads of upper units usually have no section/subsection
+                if parent != snapfile.NONE:
+                    break
+            unit = level_children.get(code)
+            if unit is None:
+                unit = level_children[code] = len(units)
+                units.append((depth, code, row[name_col], row[LOKASI], parent))
+                children.append({})
+            parent = unit
+            level_children = children[unit]
+            path[level] = unit
+        row_unit.append(parent)
+        row_head.append(path.get(head_level(row[JABATAN]), snapfile.NONE))
+    return units, row_unit, row_head
+
+def encode(rows, version=None):
+    """snapfile contents for snapshot ``rows`` (tuples)."""
+    units, row_unit, row_head = _layout(rows)
+    return snapfile.encode(rows, version or rows_version(rows), time.time(),
+                           units, row_unit, row_head, NPK, USERNAME)
+
+
+class Rows(Sequence):
+    """Employee rows of a snapshot image (or the subset at ``positions``), decoded on access."""
+
+    def __init__(self, image, positions=None):
+        self._image = image
+        self._positions = positions
+
+    def __len__(self):
+        return self._image.n_rows if self._positions is None else len(self._positions)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return self._image.row(index if self._positions is None else self._positions[index])
+
+    def __iter__(self):
+        row = self._image.row
+        return map(row, range(self._image.n_rows) if self._positions is None else self._positions)
+
+
+class _ByNpk(Mapping):
+    """NPK -> employee row, binary searched in the image's NPK index."""
+
+    def __init__(self, image):
+        self._image = image
+
+    def position(self, npk):
+        npk = snapfile.normalize(npk)
+        if not isinstance(npk, int):
+            return None
+        keys = self._image.npk_keys
+        i = bisect_left(keys, npk)
+        if i < len(keys) and keys[i] == npk:
+            return self._image.npk_rows[i]
+        return None
+
+    def __getitem__(self, npk):
+        position = self.position(npk)
+        if position is None:
+            raise KeyError(npk)
+        return self._image.row(position)
+
+    def __contains__(self, npk):
+        return self.position(npk) is not None
+
+    def __iter__(self):
+        return iter(self._image.npk_keys.tolist())
+
+    def __len__(self):
+        return len(self._image.npk_keys)
+
+
+class _UnitByNpk(Mapping):
+    """NPK -> the deepest unit the employee is in."""
+
+    def __init__(self, image, by_npk, units):
+        self._image = image
+        self._by_npk = by_npk
+        self._units = units
+
+    def __getitem__(self, npk):
+        position = self._by_npk.position(npk)
+        if position is None:
+            raise KeyError(npk)
+        return self._units[self._image.row_unit[position]]
+
+    def __contains__(self, npk):
+        return npk in self._by_npk
+
+    def __iter__(self):
+        return iter(self._by_npk)
+
+    def __len__(self):
+        return len(self._by_npk)
+
+
+class _ByUsername(Mapping):
+    """Lowercased username -> employee row, binary searched in the image's username index."""
+
+    def __init__(self, image):
+        self._image = image
+
+    def _key(self, i):
+        return self._image.value(self._image.cells[self._image.user_rows[i] * snapfile.COLUMNS + USERNAME]).lower()
+
+    def __getitem__(self, username):
+        lo, hi = 0, len(self._image.user_rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < username:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._image.user_rows) and self._key(lo) == username:
+            return self._image.row(self._image.user_rows[lo])
+        raise KeyError(username)
+
+    def __iter__(self):
+        return map(self._key, range(len(self._image.user_rows)))
+
+    def __len__(self):
+        return len(self._image.user_rows)
+
+
+def _group_rows(image, column):
+    """Value of ``column`` -> Rows having it, in snapshot order."""
+    positions = {}
+    for position, ref in enumerate(image.column_refs(column)):
+        group = positions.get(ref)
+        if group is None:
+            group = positions[ref] = array("I")
+        group.append(position)
+    return {image.value(ref): Rows(image, group) for ref, group in positions.items()}
+
+
+class OrgSnapshot:
+    """Immutable, indexed copy of HRIS_TrAD.
+
+    Rows and the NPK/username indexes are read straight from a snapfile
+    image: the file shared by all workers when it is mapped, or bytes in
+    this process for a snapshot it loaded itself. Only the unit tree is
+    built as objects. A refresh builds a new instance and swaps it in, so
+    readers never see a half-built snapshot and never need a lock.
+    """
+
+    def __init__(self, rows=None, image=None):
+        if image is None:
+            image = snapfile.Image(encode([tuple(row) for row in rows]))
+        self.image = image
+        self.version = image.version
+        self.loaded_at = image.loaded_at
+        self.rows = Rows(image)
+
+        self.roots = {}
+        self.units_by_code = {level: {} for level in LEVELS}
+        self.units_by_name = {level: {} for level in LEVELS}
+        units = []
+        for i in range(image.n_units):
+            depth, code, name, lokasi, parent = image.unit(i)
+            units.append(self._add_unit(
+                LEVELS[depth], image.value(code), image.value(name), image.value(lokasi),
+                units[parent] if parent != snapfile.NONE else None,
+            ))
+        for position, unit in enumerate(image.row_head):
+            if unit != snapfile.NONE:
+                units[unit].heads.append(image.row(position))
+
+        self.employees_by_npk = _ByNpk(image)
+        self.unit_by_npk = _UnitByNpk(image, self.employees_by_npk, units)
+        self.employees_by_username = _ByUsername(image)
+        self.employees_by_dir = _group_rows(image, DIR)
+        self.employees_by_div = _group_rows(image, DIV)
+
+        self._level_rows = {}
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._memo_builds = SingleFlight("snapshot_memo")
+        self._search = None
+        self._search_lock = threading.Lock()
+
+    def _add_unit(self, level, code, name, lokasi, parent):
+        unit = Unit(level, code, name, lokasi, parent)
+        (parent.children if parent is not None else self.roots)[code] = unit
+        self.units_by_code[level].setdefault(code, []).append(unit)
+        if name is not None:
+            self.units_by_name[level].setdefault(str(name).lower(), []).append(unit)
+        return unit
+
+    def level_rows(self, level):
+        """Distinct rows of /structures for ``level`` (equivalent of SELECT DISTINCT)."""
+        rows = self._level_rows.get(level)
+        if rows is None:
+            # Equal values share a ref in the image, so dedupe on refs and decode only the survivors
+            columns = LEVEL_COLUMNS[level]
+            image = self.image
+            refs = dict.fromkeys(
+                tuple(image.cells[i * snapfile.COLUMNS + c] for c in columns) for i in range(image.n_rows)
+            )
+            rows = [tuple(image.value(ref) for ref in key) for key in refs]
+            self._level_rows[level] = rows
+        return rows
+
+    def structure_rows(self, level, dirname=None, divname=None, dptname=None):
+        if not (dirname or divname or dptname):
+            return self.level_rows(level)
+        # Filters apply to the employee rows, like the WHERE clause they
+        # replace, so they also work on levels that don't select the column.
+        rows = self.employees_by_dir.get(dirname, ()) if dirname else self.rows
+        columns = LEVEL_COLUMNS[level]
+        return list(dict.fromkeys(
+            tuple(row[c] for c in columns) for row in rows
+            if (not divname or row[DIVNAME] == divname)
+            and (not dptname or row[DEPTNAME] == dptname)
+        ))
+
+    def sparse_structure_rows(self, columns, root_column=None, root=None, dirname=None, divname=None, dptname=None):
+        """Distinct ``columns`` of the employee rows, in snapshot order.
+
+        Only rows whose ``root_column`` is ``root`` when given, filtered like
+        structure_rows. Groups come out contiguous, as the ORDER BY of
+        queries.sparse_structures makes them.
+        """
+        if root_column == DIR:
+            rows = self.employees_by_dir.get(root, ())
+        elif root_column == DIV:
+            rows = self.employees_by_div.get(root, ())
+        else:
+            rows = self.employees_by_dir.get(dirname, ()) if dirname else self.rows
+        return list(dict.fromkeys(
+            tuple(row[c] for c in columns) for row in rows
+            if (root_column is None or row[root_column] == root)
+            and (not dirname or row[DIR] == dirname)
+            and (not divname or row[DIVNAME] == divname)
+            and (not dptname or row[DEPTNAME] == dptname)
+        ))
+
+    def dir_rows(self, dir_id):
+        return [
+            (r[DIR], r[DIRNAME], r[DIV], r[DIVNAME], r[DEPT], r[DEPTNAME], r[NPK], r[NAME], r[EMAIL], r[JABATAN])
+            for r in self.employees_by_dir.get(dir_id, ())
+        ]
+
+    def div_rows(self, div_id):
+        return [
+            (r[DIV], r[DIVNAME], r[DEPT], r[DEPTNAME], r[NPK], r[NAME], r[EMAIL], r[JABATAN])
+            for r in self.employees_by_div.get(div_id, ())
+        ]
+
+    def approval_chain(self, npk):
+        """Units above ``npk`` that have a head, nearest first, as (unit, heads).
+
+        A head's chain starts above the unit they head, so a department
+        head's chain starts at their division. Returns None if the NPK is
+        unknown.
+        """
+        unit = self.unit_by_npk.get(npk)
+        if unit is None:
+            return None
+        own_level = head_level(self.employees_by_npk[npk][JABATAN])
+        top = LEVELS.index(own_level) if own_level else len(LEVELS)
+        chain = []
+        while unit is not None:
+            if LEVELS.index(unit.level) < top:
+                heads = [row for row in unit.heads if row[NPK] != npk]
+                if heads:
+                    chain.append((unit, heads))
+            unit = unit.parent
+        return chain
+
+    def unit_index(self):
+        index = {}
+        for level in LEVELS:
+            for units in self.units_by_code[level].values():
+                for unit in units:
+                    index.setdefault(unit_key(unit), unit)
+        return index
+
+    def search_index(self):
+        """Employee search index over NPK, username, name and email, built on first use."""
+        if self._search is None:
+            with self._search_lock:
+                if self._search is None:
+                    self._search = SearchIndex(
+                        self.rows, (NPK, USERNAME, NAME, EMAIL),
+                        sort_key=lambda row: (str(row[NAME] or "").lower(), row[NPK]),
+                    )
+        return self._search
+
+    def has_search_index(self):
+        return self._search is not None
+
+    def memo(self, key, build):
+        """Return the cached result for ``key``, building it once per snapshot."""
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        # A burst of requests for the same uncached key builds it once
+        value = self._memo_builds.do(key, build, key[0])
+        with self._memo_lock:
+            self._memo[key] = value
+            while len(self._memo) > SNAPSHOT_MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return value
+
+
+def _unit_change(change, unit, **extra):
+    return {"change": change, "level": unit.level, "code": unit.code, "name": unit.name,
+            "path": unit_path(unit), **extra}
+
+def _employee_change(change, snap, npk, **extra):
+    row = snap.employees_by_npk[npk]
+    return {"change": change, "NPK": npk, "NAME": row[NAME], "USERNAME": row[USERNAME],
+            "EMAIL": row[EMAIL], "ROLE": row[JABATAN], "path": unit_path(snap.unit_by_npk[npk]), **extra}
+
+def diff(old, new):
+    """Units and employees added, removed, moved, renamed (or otherwise updated) from ``old`` to ``new``."""
+    units = []
+    old_units, new_units = old.unit_index(), new.unit_index()
+    for key, unit in new_units.items():
+        before = old_units.get(key)
+        if before is None:
+            units.append(_unit_change("added", unit))
+            continue
+        old_path, new_path = unit_path(before), unit_path(unit)
+        if old_path[:-1] != new_path[:-1]:
+            units.append(_unit_change("moved", unit, old_path=old_path))
+        if before.name != unit.name:
+            units.append(_unit_change("renamed", unit, old_name=before.name))
+    for key, unit in old_units.items():
+        if key not in new_units:
+            units.append(_unit_change("removed", unit))
+
+    employees = []
+    for npk, row in new.employees_by_npk.items():
+        before = old.employees_by_npk.get(npk)
+        if before is None:
+            employees.append(_employee_change("added", new, npk))
+            continue
+        old_path = unit_path(old.unit_by_npk[npk])
+        if old_path != unit_path(new.unit_by_npk[npk]):
+            employees.append(_employee_change("moved", new, npk, old_path=old_path))
+        if before[NAME] != row[NAME]:
+            employees.append(_employee_change("renamed", new, npk, old_name=before[NAME]))
+        changed = [field for field, column in (("USERNAME", USERNAME), ("EMAIL", EMAIL), ("ROLE", JABATAN), ("LOKASI", LOKASI))
+                   if before[column] != row[column]]
+        if changed:
+            employees.append(_employee_change("updated", new, npk, fields=changed))
+    for npk in old.employees_by_npk:
+        if npk not in new.employees_by_npk:
+            employees.append(_employee_change("removed", old, npk))
+
+    return {"units": units, "employees": employees}
+
+
+_current = None
+_refresher = None
+_refresher_lock = threading.Lock()
+
+# Name of the shared snapfile _current was mapped from, and the lock that
+# makes this worker the one refreshing it from the DB
+_mapped = None
+_shared_lock = snapfile.RefresherLock(SNAPSHOT_SHARED_DIR) if SNAPSHOT_SHARED_DIR else None
+
+# (version, loaded_at, changes from the version before it) of the last
+# SNAPSHOT_HISTORY distinct snapshots, oldest first. When shared, the
+# refreshing worker saves it to SNAPSHOT_SHARED_DIR and the others reload
+# it from there, so /structures/changes gives the same answer on any worker.
+_history = deque(maxlen=SNAPSHOT_HISTORY)
+_history_lock = threading.Lock()
+_history_stamp = None
+
+def current():
+    """The active snapshot, or None if disabled or not loaded yet.
+
+    While the INFO database is unavailable the snapshot can't be
+    refreshed, so responses built from it are marked stale.
+    """
+    snap = _current
+    if snap is not None and info_pool.breaker.state != breaker.CLOSED:
+        breaker.mark_stale(time.time() - snap.loaded_at)
+    return snap
+
+def load():
+    return OrgSnapshot(queries.fetch_all(info_db_connection, queries.SNAPSHOT, stale_ok=False))
+
+def load_directorate_of(npk):
+    """Snapshot of just the directorate ``npk`` works in, for when the full one isn't loaded."""
+    # Not kept for stale fallback: a whole directorate per NPK would crowd out everything else
+    return OrgSnapshot(queries.fetch_all(info_db_connection, queries.DIRECTORATE_SNAPSHOT, (npk,), stale_ok=False))
+
+def _load_shared_history():
+    """Replace _history with the shared one if another worker saved a newer one."""
+    global _history_stamp
+    with _history_lock:
+        entries, _history_stamp = snapfile.read_history(SNAPSHOT_SHARED_DIR, _history_stamp)
+        if entries is not None:
+            _history.clear()
+            _history.extend(tuple(entry) for entry in entries)
+
+def _record(snap):
+    """Add ``snap`` to the history, with its changes from the snapshot in use, and save it if shared."""
+    global _history_stamp
+    previous = _current
+    if previous is not None and previous.version == snap.version:
+        return
+    shared = _shared_lock is not None and _shared_lock.held
+    if shared:
+        _load_shared_history()
+    changes = diff(previous, snap) if previous is not None else None
+    with _history_lock:
+        if previous is not None and (not _history or _history[-1][0] != previous.version):
+            # The history doesn't end where this diff starts (new refresher, file lost): restart it there
+            _history.clear()
+            _history.append((previous.version, previous.loaded_at, None))
+        _history.append((snap.version, snap.loaded_at, changes))
+        if shared:
+            snapfile.write_history(SNAPSHOT_SHARED_DIR, list(_history))
+            _history_stamp = None
+
+def _install(snap, logger, started, source):
+    global _current
+    # The index is built on the first /users/search of each worker. One
+    # that has served searches rebuilds it here, off the request path.
+    if _current is not None and _current.has_search_index():
+        snap.search_index()
+    _current = snap
+    if logger:
+        logger.info(
+            f"Org snapshot {snap.version[:12]} {source}: {len(snap.rows)} employees "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+
+def refresh(logger=None):
+    """Load HRIS_TrAD and swap the new snapshot in. Returns True if the data changed.
+
+    The worker holding the shared refresher lock also publishes the
+    snapshot to SNAPSHOT_SHARED_DIR and maps it from there like the others.
+    """
+    global _mapped
+    started = time.monotonic()
+    rows = [tuple(row) for row in queries.fetch_all(info_db_connection, queries.SNAPSHOT, stale_ok=False)]
+    version = rows_version(rows)
+    previous = _current
+    if previous is not None and previous.version == version:
+        previous.loaded_at = time.time()
+        return False
+    data = encode(rows, version)
+    del rows
+    if _shared_lock is not None and _shared_lock.held:
+        name = snapfile.write_file(SNAPSHOT_SHARED_DIR, data, version)
+        snap = OrgSnapshot(image=snapfile.open_image(SNAPSHOT_SHARED_DIR, name))
+        # History first: a worker that maps the new version must find it there
+        _record(snap)
+        snapfile.publish(SNAPSHOT_SHARED_DIR, name)
+        # The previous file may still be mapped by workers that haven't polled yet
+        snapfile.remove_old_files(SNAPSHOT_SHARED_DIR, {name, _mapped})
+        _mapped = name
+    else:
+        snap = OrgSnapshot(image=snapfile.Image(data))
+        if _shared_lock is None:
+            _record(snap)
+    _install(snap, logger, started, "loaded")
+    return True
+
+def adopt_shared(logger=None):
+    """Map the snapshot another worker published, if it isn't the one in use. Returns True if the data changed."""
+    global _mapped
+    name = snapfile.current_name(SNAPSHOT_SHARED_DIR)
+    if name is None or name == _mapped:
+        return False
+    started = time.monotonic()
+    snap = OrgSnapshot(image=snapfile.open_image(SNAPSHOT_SHARED_DIR, name))
+    changed = _current is None or _current.version != snap.version
+    # Same data loaded privately is still swapped, to drop this worker's copy
+    _install(snap, logger, started, "mapped")
+    _mapped = name
+    return changed
+
+def sync(logger=None, interval=SNAPSHOT_REFRESH_INTERVAL):
+    """Bring the snapshot up to date. Returns True if the data changed.
+
+    Without SNAPSHOT_SHARED_DIR every worker reloads from the DB. With it,
+    one worker (whoever gets the refresher lock) reloads once ``interval``
+    has passed and publishes the result; the others map what it published.
+    A worker that has nothing yet, and no file to map, loads privately.
+    """
+    if _shared_lock is None:
+        return refresh(logger)
+    changed = adopt_shared(logger)
+    if _shared_lock.acquire():
+        if _current is None or time.time() - _current.loaded_at >= interval:
+            changed = refresh(logger) or changed
+    elif _current is None:
+        changed = refresh(logger)
+    return changed
+
+def changes_since(version):
+    """Changes of every snapshot loaded after ``version``, oldest first.
+
+    Returns None when ``version`` is not in the retained history (too
+    old); the caller has to resync in full. With SNAPSHOT_SHARED_DIR the
+    history is the shared one, so the answer doesn't depend on the worker.
+    """
+    if _shared_lock is not None:
+        _load_shared_history()
+    with _history_lock:
+        history = list(_history)
+    for index in range(len(history) - 1, -1, -1):
+        if history[index][0] == version:
+            return [
+                {"version": v, "loaded_at": loaded_at, **changes}
+                for v, loaded_at, changes in history[index + 1:]
+            ]
+    return None
+
+def _refresh_loop(logger, interval):
+    # Shared snapshots are polled for more often than they are reloaded
+    wait = SNAPSHOT_SHARED_POLL if _shared_lock is not None else interval
+    # Warm-up may have loaded it already
+    if _current is not None:
+        time.sleep(wait)
+    while True:
+        try:
+            sync(logger, interval)
+        except Exception as e:
+            logger.error(f"Error refreshing org snapshot: {e}", exc_info=True)
+        time.sleep(wait)
+
+def start_refresher(logger, interval=SNAPSHOT_REFRESH_INTERVAL):
+    """Start the background thread that loads and periodically refreshes the snapshot."""
+    global _refresher
+    if not SNAPSHOT_ENABLED:
+        return
+    with _refresher_lock:
+        if _refresher is not None:
+            return
+        _refresher = threading.Thread(
+            target=_refresh_loop, args=(logger, interval), name="org-snapshot", daemon=True
+        )
+        _refresher.start()
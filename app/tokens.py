@@ -0,0 +1,127 @@
+import datetime
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+import jwt
+import pyodbc
+from app import queries
+from app.models import auth_db_connection
+from config import ACCESS_TOKEN_TTL, REFRESH_TOKEN_TTL, REFRESH_SECRET_KEY, REVOCATION_CACHE_TTL
+
+
+class RevokedTokenError(jwt.InvalidTokenError):
+    pass
+
+
+def issue_access_token(username, secret_key):
+    """Access token accepted by token_required, valid for ACCESS_TOKEN_TTL seconds."""
+    # Generate a secure random token using CSPRNG
+    random_bytes = secrets.token_bytes(32)
+
+    # Hash the random bytes for added security
+    token_hash = hashlib.sha256(random_bytes).hexdigest()
+
+    return jwt.encode(
+        {
+            "user_id": username,
+            "token_hash": token_hash,
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=ACCESS_TOKEN_TTL),
+        },
+        secret_key,
+        algorithm="HS256",
+    )
+
+def _refresh_key(secret_key):
+    # A key of their own, so token_required never accepts a refresh token as an access token
+    if REFRESH_SECRET_KEY:
+        return REFRESH_SECRET_KEY
+    return hmac.new(secret_key.encode("utf-8"), b"refresh-token", hashlib.sha256).hexdigest()
+
+def issue_refresh_token(username, secret_key):
+    """Refresh token for POST /token/refresh, valid for REFRESH_TOKEN_TTL seconds unless revoked."""
+    return jwt.encode(
+        {
+            "user_id": username,
+            "jti": secrets.token_hex(16),
+            "type": "refresh",
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=REFRESH_TOKEN_TTL),
+        },
+        _refresh_key(secret_key),
+        algorithm="HS256",
+    )
+
+def decode_refresh_token(token, secret_key, check_revoked=True):
+    """Claims of a valid refresh token.
+
+    Raises jwt.ExpiredSignatureError, RevokedTokenError or another
+    jwt.InvalidTokenError.
+    """
+    data = jwt.decode(token, _refresh_key(secret_key), algorithms=["HS256"], options={"require": ["exp", "jti"]})
+    if data.get("type") != "refresh":
+        raise jwt.InvalidTokenError("Not a refresh token")
+    if check_revoked and revocations.contains(data["jti"]):
+        raise RevokedTokenError("Refresh token has been revoked")
+    return data
+
+
+class RevocationList:
+    """jti of revoked, unexpired refresh tokens, reloaded from I_TokenRevocation every ``ttl`` seconds.
+
+    Revocations made by this worker apply at once; those made by other
+    workers once the list is reloaded. If a reload fails the previous list
+    is used until the next one.
+    """
+
+    def __init__(self, ttl=REVOCATION_CACHE_TTL):
+        self.ttl = ttl
+        self._jtis = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        # Wait only if there is nothing to check against yet, otherwise
+        # let one thread reload while the others use the current list
+        if not self._lock.acquire(blocking=self._jtis is None):
+            return
+        try:
+            if self._jtis is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            try:
+                rows = queries.fetch_all(
+                    auth_db_connection, queries.REVOKED_TOKENS, (datetime.datetime.utcnow(),), stale_ok=False
+                )
+            except Exception:
+                if self._jtis is None:
+                    raise
+                self._loaded_at = time.monotonic()
+                return
+            self._jtis = frozenset(row[0] for row in rows)
+            self._loaded_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def contains(self, jti):
+        if self._jtis is None or time.monotonic() - self._loaded_at >= self.ttl:
+            self._reload()
+        return jti in self._jtis
+
+    def revoke(self, jti, username, expires_at):
+        """Record ``jti`` in I_TokenRevocation and drop revocations that have expired."""
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            with auth_db_connection() as conn:
+                cursor = conn.cursor()
+                queries.execute(cursor, queries.PURGE_REVOKED_TOKENS, (now,))
+                try:
+                    queries.execute(cursor, queries.REVOKE_TOKEN, (jti, username, expires_at))
+                except pyodbc.IntegrityError:
+                    pass  # already revoked
+                conn.commit()
+                cursor.close()
+            if self._jtis is not None:
+                self._jtis = self._jtis | {jti}
+
+
+revocations = RevocationList()
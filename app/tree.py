@@ -0,0 +1,197 @@
+from app.encoding import dumps
+
+# Bytes buffered before a chunk is handed to the response stream
+CHUNK_SIZE = 16384
+
+
+class Level:
+    """One level of a hierarchy encoded by ``iter_tree_json``.
+
+    ``code`` is the row column the level groups on and ``key`` the JSON key
+    it is written under. ``fields`` are ``(json key, column)`` pairs copied
+    from the first row of the group, ``children`` is the key of the list
+    holding the next level, ``empty`` lists keys always written as ``[]``,
+    and ``heads`` is ``(json key, match(row), person(row))`` to collect the
+    rows of the group that head it.
+    """
+
+    def __init__(self, key, code, fields=(), children=None, empty=(), heads=None):
+        self.key = key
+        self.code = code
+        self.fields = fields
+        self.children = children
+        self.empty = empty
+        self.heads = heads
+
+
+def iter_tree_json(rows, levels):
+    """Encode rows as a nested JSON array in a single pass.
+
+    Rows must be ordered so that each group is contiguous at every level
+    (what the ORDER BY of the query guarantees). Nodes are written as soon
+    as they open and closed when the group key changes, so no intermediate
+    tree is built; only head lists of the open groups are kept.
+    """
+    depth_max = len(levels)
+    open_codes = []
+    heads = [[] for _ in levels]
+    first = [True] * (depth_max + 1)
+    buf = ["["]
+    size = 1
+
+    def close(depth):
+        level = levels[depth]
+        parts = []
+        if level.children:
+            parts.append("]")
+        if level.heads:
+            parts.append(f',"{level.heads[0]}":{dumps(heads[depth])}')
+            heads[depth] = []
+        parts.append("}")
+        return "".join(parts)
+
+    for row in rows:
+        depth = 0
+        while depth < len(open_codes) and open_codes[depth] == row[levels[depth].code]:
+            depth += 1
+
+        while len(open_codes) > depth:
+            part = close(len(open_codes) - 1)
+            buf.append(part)
+            size += len(part)
+            open_codes.pop()
+
+        for d in range(depth, depth_max):
+            level = levels[d]
+            code = row[level.code]
+            parts = ["," if not first[d] else "", "{", f'"{level.key}":', dumps(code)]
+            first[d] = False
+            for json_key, column in level.fields:
+                parts.append(f',"{json_key}":{dumps(row[column])}')
+            for json_key in level.empty:
+                parts.append(f',"{json_key}":[]')
+            if level.children:
+                parts.append(f',"{level.children}":[')
+                first[d + 1] = True
+            part = "".join(parts)
+            buf.append(part)
+            size += len(part)
+            open_codes.append(code)
+
+        for d in range(depth_max):
+            if levels[d].heads:
+                _, match, person = levels[d].heads
+                if match(row):
+                    heads[d].append(person(row))
+
+        if size >= CHUNK_SIZE:
+            yield "".join(buf)
+            buf = []
+            size = 0
+
+    while open_codes:
+        buf.append(close(len(open_codes) - 1))
+        open_codes.pop()
+    buf.append("]")
+    yield "".join(buf)
+
+
+def tree_json(rows, levels):
+    """The whole document of ``iter_tree_json`` as one string."""
+    return "".join(iter_tree_json(rows, levels))
+
+
+def _head_of(title, jabatan_col):
+    return lambda row: bool(row[jabatan_col]) and title in row[jabatan_col].lower()
+
+
+# /structures?level=... over the DISTINCT rows selected for that level.
+# Key names (including "SECTIO"/"SUBSECTIO", and which nodes carry names)
+# are kept exactly as the original nested-dict formatter produced them.
+STRUCTURE_LEVELS = {
+    "dir": [
+        Level("DIR", 0, fields=(("DIRNAME", 1), ("LOKASI", 2)), empty=("DIVISIONS",)),
+    ],
+    "div": [
+        Level("DIR", 0, children="DIVISIONS"),
+        Level("DIVISION", 2, fields=(("DIVNAME", 3), ("LOKASI", 4)), empty=("DEPARTMENTS",)),
+    ],
+    "dpt": [
+        Level("DIR", 0, children="DIVISIONS"),
+        Level("DIVISION", 2, children="DEPARTMENTS"),
+        Level("DEPARTMENT", 4, fields=(("DPTNAME", 5), ("LOKASI", 6)), empty=("SECTION",)),
+    ],
+    "sct": [
+        Level("DIR", 0, children="DIVISIONS"),
+        Level("DIVISION", 2, children="DEPARTMENTS"),
+        Level("DEPARTMENT", 4, children="SECTION"),
+        Level("SECTIO", 6, fields=(("SECNAME", 6), ("LOKASI", 7)), empty=("SUBSECTION",)),
+    ],
+    "subsect": [
+        Level("DIR", 0, children="DIVISIONS"),
+        Level("DIVISION", 2, children="DEPARTMENTS"),
+        Level("DEPARTMENT", 4, children="SECTION"),
+        Level("SECTIO", 6, children="SUBSECTION"),
+        Level("SUBSECTIO", 7, fields=(("SUBSECNAME", 7), ("LOKASI", 8))),
+    ],
+}
+
+# (node key, children key, name key) of each /structures level, top down
+STRUCTURE_KEYS = (
+    ("DIR", "DIVISIONS", "DIRNAME"),
+    ("DIVISION", "DEPARTMENTS", "DIVNAME"),
+    ("DEPARTMENT", "SECTION", "DPTNAME"),
+    ("SECTIO", "SUBSECTION", "SECNAME"),
+    ("SUBSECTIO", None, "SUBSECNAME"),
+)
+
+def sparse_structure_levels(top, bottom, fields):
+    """Levels for rows laid out as queries.structure_columns: codes of ``top``..``bottom``, then ``fields``.
+
+    Unlike STRUCTURE_LEVELS, the deepest level has no empty child list and
+    only the fields asked for.
+    """
+    levels = []
+    for depth in range(top, bottom + 1):
+        key, children, name_key = STRUCTURE_KEYS[depth]
+        column = depth - top
+        if depth < bottom:
+            levels.append(Level(key, column, children=children))
+            continue
+        leaf_fields = []
+        extra = bottom - top + 1
+        if "name" in fields:
+            # Sections are named by their code
+            if depth >= 3:
+                leaf_fields.append((name_key, column))
+            else:
+                leaf_fields.append((name_key, extra))
+                extra += 1
+        if "lokasi" in fields:
+            leaf_fields.append(("LOKASI", extra))
+        levels.append(Level(key, column, fields=tuple(leaf_fields)))
+    return levels
+
+def _person(npk, name, email, jabatan, role_key):
+    return lambda row: {"NPK": row[npk], "NAME": row[name], "EMAIL": row[email], role_key: row[jabatan]}
+
+
+# /structures/dir/<id>: (dir, dirName, div, div_name, dept, deptName, npk, name, email, jabatan)
+_dir_person = _person(6, 7, 8, 9, "ROLE")
+DIR_LEVELS = [
+    Level("DIR", 0, fields=(("DIRNAME", 1),), children="DIVISIONS",
+          heads=("DIRHEAD", _head_of("director", 9), _dir_person)),
+    Level("DIV", 2, fields=(("DIVNAME", 3),), children="DEPARTMENTS",
+          heads=("DIVHEAD", _head_of("division head", 9), _dir_person)),
+    Level("DPT", 4, fields=(("DPTNAME", 5),),
+          heads=("DPTHEAD", _head_of("department head", 9), _dir_person)),
+]
+
+# /structures/div/<id>: (div, div_name, dept, deptName, npk, name, email, jabatan)
+_div_person = _person(4, 5, 6, 7, "JABATAN")
+DIV_LEVELS = [
+    Level("DIV", 0, fields=(("DIVNAME", 1),), children="DEPARTMENTS",
+          heads=("DIVHEAD", _head_of("division head", 7), _div_person)),
+    Level("DPT", 2, fields=(("DPTNAME", 3),),
+          heads=("DPTHEAD", _head_of("department head", 7), _div_person)),
+]
@@ -0,0 +1,68 @@
+import time
+from contextlib import contextmanager
+from app import snapshot, hashing
+from app.models import auth_pool, info_pool
+from config import get_odbc_driver, SNAPSHOT_ENABLED, WARMUP_DB_CONNECTIONS, WARMUP_SNAPSHOT
+
+
+class StartupReport:
+    """Time spent in each step of bringing the worker up, in the order they ran."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.errors = {}
+        self.ready = False
+        self.ready_at = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_at = time.time()
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        return {
+            "ready": self.ready,
+            "ready_at": self.ready_at,
+            "total_ms": round(self.total() * 1000, 1),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "errors": self.errors,
+        }
+
+    def summary(self):
+        phases = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        text = f"Worker ready in {self.total() * 1000:.0f}ms ({phases})"
+        if self.errors:
+            text += f"; warm-up failed for {', '.join(self.errors)}"
+        return text
+
+
+def _step(report, name, logger, action):
+    # A failed step leaves the work to the first request instead of failing startup
+    with report.phase(name):
+        try:
+            action()
+        except Exception as e:
+            report.errors[name] = str(e)
+            logger.warning(f"Warm-up step {name} failed: {e}", exc_info=True)
+
+
+def warm_up(app, report):
+    """Do the first-request work up front: resolve ODBC drivers, open DB connections, load the snapshot."""
+    logger = app.logger
+    _step(report, "odbc_driver", logger, lambda: (get_odbc_driver("AUTH_DB_DRIVER"), get_odbc_driver("INFO_DB_DRIVER")))
+    for pool in (auth_pool, info_pool):
+        _step(report, f"db_{pool.name}", logger, lambda pool=pool: pool.prefill(WARMUP_DB_CONNECTIONS))
+    _step(report, "bcrypt_pool", logger, hashing.start_login_pool)
+    if SNAPSHOT_ENABLED and WARMUP_SNAPSHOT:
+        _step(report, "snapshot", logger, lambda: snapshot.sync(logger))
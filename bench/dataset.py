@@ -0,0 +1,99 @@
+import random
+import sqlite3
+import bcrypt
+
+# Units per parent: directorates, divisions per directorate, departments per
+# division, sections per department, subsections per section
+DEFAULT_FANOUT = (8, 5, 5, 4, 3)
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench-password"
+
+FIRST_NAMES = ("Adi", "Budi", "Citra", "Dewi", "Eko", "Fajar", "Gita", "Hadi", "Indah", "Joko",
+               "Kartika", "Lestari", "Made", "Nur", "Putri", "Rudi", "Sari", "Tono", "Wulan", "Yusuf")
+LAST_NAMES = ("Santoso", "Wijaya", "Pratama", "Saputra", "Hidayat", "Nugroho", "Kusuma",
+              "Setiawan", "Siregar", "Harahap", "Lubis", "Purba", "Gunawan", "Halim")
+LOCATIONS = ("JKT", "BKS", "KRW", "SBY", "SMG")
+
+SCHEMA = """
+CREATE TABLE HRIS_TrAD (
+    dir TEXT, dirName TEXT, div TEXT, div_name TEXT, dept TEXT, deptName TEXT,
+    sec TEXT, subsec TEXT, idLokasi TEXT,
+    npk INTEGER PRIMARY KEY, username TEXT, name TEXT, email TEXT, jabatan TEXT
+);
+CREATE INDEX ix_hris_username ON HRIS_TrAD (username);
+CREATE INDEX ix_hris_dir ON HRIS_TrAD (dir, div, dept, sec, subsec);
+CREATE INDEX ix_hris_div ON HRIS_TrAD (div);
+CREATE TABLE I_User (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+CREATE TABLE I_TokenRevocation (
+    jti TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+"""
+
+
+def generate_employees(count, fanout=DEFAULT_FANOUT, seed=42):
+    """Yield synthetic HRIS_TrAD rows.
+
+    Every unit gets one head: directors, division and department heads sit
+    at their unit with no section, section heads with no subsection, the
+    rest of the ``count`` employees are spread over the subsections.
+    """
+    rng = random.Random(seed)
+    n_dir, n_div, n_dept, n_sec, n_sub = fanout
+    npk = 100000
+
+    def person(jabatan, path):
+        nonlocal npk
+        npk += 1
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{first}.{last}{npk}".lower()
+        return path + (npk, username, f"{first} {last}", f"{username}@adm.example", jabatan)
+
+    subsections = []
+    heads = []
+    for d in range(n_dir):
+        dir_code = f"D{d:02d}"
+        dir_path = (dir_code, f"Directorate {d:02d}")
+        lokasi = LOCATIONS[d % len(LOCATIONS)]
+        # Directors are listed under their first division
+        first_div = f"{dir_code}V00"
+        heads.append(person("Director", dir_path + (first_div, f"Division {first_div}", None, None, None, None, lokasi)))
+        for v in range(n_div):
+            div_code = f"{dir_code}V{v:02d}"
+            div_path = dir_path + (div_code, f"Division {div_code}")
+            heads.append(person("Division Head", div_path + (None, None, None, None, lokasi)))
+            for p in range(n_dept):
+                dept_code = f"{div_code}P{p:02d}"
+                dept_path = div_path + (dept_code, f"Department {dept_code}")
+                heads.append(person("Department Head", dept_path + (None, None, lokasi)))
+                for s in range(n_sec):
+                    sec = f"Section {dept_code}S{s}"
+                    heads.append(person("Section Head", dept_path + (sec, None, lokasi)))
+                    for u in range(n_sub):
+                        subsections.append(dept_path + (sec, f"Subsection {dept_code}S{s}U{u}", lokasi))
+
+    yield from heads[:count]
+    remaining = max(count - len(heads), 0)
+    for i in range(remaining):
+        path = subsections[i % len(subsections)]
+        jabatan = "Subsection Head" if i < len(subsections) else rng.choice(("Staff", "Staff", "Staff", "Officer", "Supervisor"))
+        yield person(jabatan, path)
+
+
+def build_database(path, employees, fanout=DEFAULT_FANOUT, bcrypt_rounds=12, seed=42):
+    """Create the SQLite stand-in for both databases at ``path``."""
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO HRIS_TrAD VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        generate_employees(employees, fanout, seed),
+    )
+    hashed = bcrypt.hashpw(BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt(bcrypt_rounds))
+    conn.execute("INSERT INTO I_User (username, password) VALUES (?, ?)", (BENCH_USERNAME, hashed.decode("utf-8")))
+    conn.commit()
+    conn.close()
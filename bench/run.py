@@ -0,0 +1,274 @@
+"""Offline benchmark of every endpoint against a synthetic SQLite HRIS_TrAD.
+
+    python -m bench.run --employees 50000 --requests 200
+    python -m bench.run --employees 50000 --compare bench/results/<earlier>.json
+
+Both databases are replaced by bench.shim, so no SQL Server is needed.
+Results are written to bench/results/ as JSON.
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The benchmark drives snapshot refreshes itself, and the pools only point
+# at the stand-in after import, so nothing may connect while the app starts
+os.environ.setdefault("SNAPSHOT_ENABLED", "False")
+os.environ.setdefault("WARMUP_ENABLED", "False")
+# One process: load the snapshot privately, keeping its /structures/changes history here
+os.environ.setdefault("SNAPSHOT_SHARED_DIR", "")
+
+from app import app, export, models, snapshot, tokens  # noqa: E402
+from bench import dataset, shim  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Endpoints that answer 503 until the org snapshot is loaded, not run in db mode
+SNAPSHOT_ONLY = {"structures_changes"} | {f"export_{fmt}" for fmt in export.ALL_FORMATS}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def load_samples(db_path, seed):
+    conn = sqlite3.connect(db_path)
+    rng = random.Random(seed)
+    npks = [r[0] for r in conn.execute("SELECT npk FROM HRIS_TrAD")]
+    usernames = [r[0] for r in conn.execute("SELECT username FROM HRIS_TrAD")]
+    dirs = [r[0] for r in conn.execute("SELECT DISTINCT dir FROM HRIS_TrAD")]
+    divs = [r[0] for r in conn.execute("SELECT DISTINCT div FROM HRIS_TrAD WHERE div IS NOT NULL")]
+    conn.close()
+    return rng, npks, usernames, dirs, divs
+
+
+def build_cases(db_path, seed, run_id):
+    """(name, method, url(i), json body(i) or None, heavy) for every endpoint."""
+    rng, npks, usernames, dirs, divs = load_samples(db_path, seed)
+    login_body = {"username": dataset.BENCH_USERNAME, "password": dataset.BENCH_PASSWORD}
+    refresh_body = {"refresh_token": tokens.issue_refresh_token(dataset.BENCH_USERNAME, app.config["SECRET_KEY"])}
+    revoked_body = {"refresh_token": tokens.issue_refresh_token(dataset.BENCH_USERNAME, app.config["SECRET_KEY"])}
+    cases = [
+        ("login", "POST", lambda i: "/login", lambda i: login_body, True),
+        ("register", "POST", lambda i: "/register",
+         lambda i: {"username": f"bench-{run_id}-{i}", "password": "x" * 12}, True),
+        ("register_bulk", "POST", lambda i: "/register/bulk",
+         lambda i: {"users": [{"username": f"bench-{run_id}-{i}-{n}", "password": "x" * 12} for n in range(20)]}, True),
+        ("token_refresh", "POST", lambda i: "/token/refresh", lambda i: refresh_body, False),
+        # A new refresh token each time, so every request inserts a revocation
+        ("token_revoke", "POST", lambda i: "/token/revoke",
+         lambda i: {"refresh_token": tokens.issue_refresh_token(dataset.BENCH_USERNAME, app.config["SECRET_KEY"])}, False),
+        # The same token every time: after the first, each request takes the already-revoked path
+        ("token_revoke_again", "POST", lambda i: "/token/revoke", lambda i: revoked_body, False),
+        ("users", "GET", lambda i: "/users", None, False),
+        ("users_page", "GET", lambda i: f"/users?limit=500&after={rng.choice(npks)}", None, False),
+        ("users_stream", "GET", lambda i: "/users?stream=ndjson", None, False),
+        ("users_npk", "GET", lambda i: f"/users/npk/{rng.choice(npks)}", None, False),
+        ("users_username", "GET", lambda i: f"/users/username/{rng.choice(usernames)}", None, False),
+        ("users_batch", "POST", lambda i: "/users/batch",
+         lambda i: {"npks": rng.sample(npks, 50), "usernames": rng.sample(usernames, 10)}, False),
+        ("users_search", "GET", lambda i: f"/users/search?q={rng.choice(usernames)[:5]}", None, False),
+    ]
+    for level in snapshot.LEVELS:
+        cases.append((f"structures_{level}", "GET", lambda i, level=level: f"/structures?level={level}", None, False))
+    cases += [
+        ("structures_filtered", "GET", lambda i: f"/structures?level=subsect&dirname={rng.choice(dirs)}", None, False),
+        ("structures_sparse", "GET", lambda i: f"/structures?level=subsect&root={rng.choice(dirs)}&depth=2&fields=", None, False),
+        ("structures_dir", "GET", lambda i: f"/structures/dir/{rng.choice(dirs)}", None, False),
+        ("structures_div", "GET", lambda i: f"/structures/div/{rng.choice(divs)}", None, False),
+        ("approval_chain", "GET", lambda i: f"/approval-chain/{rng.choice(npks)}", None, False),
+        # A client polling with the version it already has, the usual case
+        ("structures_changes", "GET", lambda i: f"/structures/changes?since={snapshot.current().version}", None, False),
+        ("metrics", "GET", lambda i: "/metrics", None, False),
+    ]
+    # The file is written on the first request (the warm-up), the rest are sent from disk
+    for fmt in export.FORMATS:
+        cases.append((f"export_{fmt}", "GET", lambda i, fmt=fmt: f"/export/snapshot?format={fmt}", None, False))
+    return cases
+
+
+def run_case(case, headers, requests, warmup, concurrency, revalidate=False):
+    name, method, url, body, _ = case
+    local = threading.local()
+
+    def one(i):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+            local.etags = {}
+        path = url(i)
+        request_headers = headers
+        if revalidate and path in local.etags:
+            request_headers = dict(headers, **{"If-None-Match": local.etags[path]})
+        started = time.perf_counter()
+        response = client.open(path, method=method, headers=request_headers, json=body(i) if body else None)
+        size = len(response.get_data())  # drains streamed bodies
+        elapsed = time.perf_counter() - started
+        if revalidate and response.headers.get("ETag"):
+            local.etags[path] = response.headers["ETag"]
+        return elapsed, response.status_code, size
+
+    for i in range(warmup):
+        one(-1 - i)
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = list(pool.map(one, range(requests)))
+    else:
+        samples = [one(i) for i in range(requests)]
+    wall = time.perf_counter() - started
+
+    latencies = sorted(s[0] * 1000 for s in samples)
+    errors = sum(1 for s in samples if s[1] >= 400)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / wall, 2) if wall else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "bytes": samples[-1][2] if samples else 0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, previous=None):
+    header = f"{'mode':<9} {'endpoint':<22} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>4}"
+    if previous:
+        header += f" {'p50 vs prev':>12} {'p99 vs prev':>12}"
+    print(header)
+    for mode, cases in results.items():
+        for name, r in cases.items():
+            line = (f"{mode:<9} {name:<22} {r['throughput_rps']:>9.1f} {r['p50_ms']:>9.2f} "
+                    f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['errors']:>4}")
+            old = (previous or {}).get(mode, {}).get(name)
+            if old:
+                for key in ("p50_ms", "p99_ms"):
+                    delta = (r[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                    line += f" {delta:>+11.1f}%"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=10000, help="synthetic HRIS_TrAD size (default 10000)")
+    parser.add_argument("--fanout", default=",".join(map(str, dataset.DEFAULT_FANOUT)),
+                        help="dir,div,dept,sec,subsec units per parent (default %(default)s)")
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per endpoint")
+    parser.add_argument("--heavy-requests", type=int, default=10, help="measured requests for bcrypt endpoints")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1, help="client threads per endpoint")
+    parser.add_argument("--mode", choices=("db", "snapshot", "both"), default="both",
+                        help="serve reads from the database, the org snapshot, or run both")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--only", help="comma separated endpoint names to run")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="send the last ETag seen for a URL as If-None-Match, like a polling client")
+    parser.add_argument("--accept-encoding", help="Accept-Encoding to send, e.g. gzip or br (default: none)")
+    parser.add_argument("--db", help="SQLite file to use (built if missing, temporary if omitted)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=RESULTS_DIR, help="directory for the results JSON")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    fanout = tuple(int(n) for n in args.fanout.split(","))
+    tmpdir = None
+    db_path = args.db
+    if not db_path:
+        tmpdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmpdir.name, "bench.db")
+    if not os.path.exists(db_path):
+        started = time.perf_counter()
+        dataset.build_database(db_path, args.employees, fanout, args.bcrypt_rounds, args.seed)
+        print(f"Built {args.employees} employees in {time.perf_counter() - started:.1f}s at {db_path}")
+
+    # Point both pools at the stand-in
+    for pool in (models.auth_pool, models.info_pool):
+        pool.close_all()
+        pool._connect = shim.connector(db_path)
+
+    client = app.test_client()
+    response = client.post("/login", json={"username": dataset.BENCH_USERNAME, "password": dataset.BENCH_PASSWORD})
+    if response.status_code != 200:
+        raise SystemExit(f"Login against the stand-in failed: {response.status_code} {response.get_data(as_text=True)}")
+    headers = {"Authorization": "Bearer " + response.get_json()["token"]}
+    if args.accept_encoding:
+        headers["Accept-Encoding"] = args.accept_encoding
+
+    run_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    cases = build_cases(db_path, args.seed, run_id)
+    if args.only:
+        wanted = set(args.only.split(","))
+        cases = [c for c in cases if c[0] in wanted]
+
+    modes = ("db", "snapshot") if args.mode == "both" else (args.mode,)
+    results = {}
+    for mode in modes:
+        if mode == "snapshot":
+            snapshot.refresh()
+        else:
+            snapshot._current = None
+        results[mode] = {}
+        for case in cases:
+            # bcrypt endpoints don't depend on the read path
+            if case[4] and mode != modes[0]:
+                continue
+            if case[0] in SNAPSHOT_ONLY and mode == "db":
+                continue
+            requests = args.heavy_requests if case[4] else args.requests
+            results[mode][case[0]] = run_case(case, headers, requests, args.warmup, args.concurrency, args.revalidate)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+    print_table(results, previous)
+
+    os.makedirs(args.output, exist_ok=True)
+    out_path = os.path.join(args.output, f"bench-{run_id}.json")
+    with open(out_path, "w") as f:
+        json.dump({
+            "meta": {
+                "run_id": run_id,
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "employees": args.employees,
+                "fanout": fanout,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "bcrypt_rounds": args.bcrypt_rounds,
+                "accept_encoding": args.accept_encoding,
+                "revalidate": args.revalidate,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"Saved {out_path}")
+
+    if tmpdir:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import re
+import sqlite3
+from contextlib import contextmanager
+import pyodbc
+
+# Translates the few SQL Server constructs the app uses into SQLite
+_TOP = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+)?)TOP\s*\(\?\)\s*", re.IGNORECASE)
+
+Error = pyodbc.Error
+
+
+@contextmanager
+def _pyodbc_errors():
+    """Raise sqlite3 errors as the pyodbc classes the app catches (pool discard, breaker, IntegrityError)."""
+    try:
+        yield
+    except sqlite3.IntegrityError as e:
+        raise pyodbc.IntegrityError(*e.args) from e
+    except sqlite3.OperationalError as e:
+        raise pyodbc.OperationalError(*e.args) from e
+    except sqlite3.Error as e:
+        raise pyodbc.Error(*e.args) from e
+
+
+def translate(sql, params):
+    """Rewrite SQL Server syntax to SQLite, moving parameters where needed."""
+    params = list(params) if params else []
+    match = _TOP.match(sql)
+    if match:
+        sql = match.group(1) + sql[match.end():] + " LIMIT ?"
+        params = params[1:] + params[:1]
+    return sql, params
+
+
+class Cursor:
+    """The subset of pyodbc.Cursor used by the app, backed by sqlite3."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.fast_executemany = False
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        sql, params = translate(sql, params)
+        with _pyodbc_errors():
+            self._cursor.execute(sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = [translate(sql, p)[1] for p in seq_of_params]
+        with _pyodbc_errors():
+            self._cursor.executemany(sql, seq_of_params)
+
+    def fetchone(self):
+        with _pyodbc_errors():
+            return self._cursor.fetchone()
+
+    def fetchall(self):
+        with _pyodbc_errors():
+            return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        with _pyodbc_errors():
+            return self._cursor.fetchmany(size)
+
+    def close(self):
+        with _pyodbc_errors():
+            self._cursor.close()
+
+
+class Connection:
+    """The subset of pyodbc.Connection used by the app, backed by sqlite3."""
+
+    def __init__(self, path):
+        with _pyodbc_errors():
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+
+    def cursor(self):
+        with _pyodbc_errors():
+            return Cursor(self._conn.cursor())
+
+    def commit(self):
+        with _pyodbc_errors():
+            self._conn.commit()
+
+    def rollback(self):
+        with _pyodbc_errors():
+            self._conn.rollback()
+
+    def close(self):
+        with _pyodbc_errors():
+            self._conn.close()
+
+
+def connector(path):
+    """A drop-in for get_auth_db_connection / get_info_db_connection."""
+    def connect():
+        return Connection(path)
+    return connect
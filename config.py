@@ -1,12 +1,19 @@
 import os
+import functools
 import pyodbc
 
+@functools.lru_cache(maxsize=None)
+def installed_odbc_drivers() -> tuple:
+    # Enumerating drivers reads the ODBC registry/ini, do it once per process
+    return tuple(pyodbc.drivers())
+
+@functools.lru_cache(maxsize=None)
 def get_odbc_driver(driver_env_variable: str) -> str:
     # Fetch the driver from environment variable (if specified)
     requested_driver = os.getenv(driver_env_variable)
     
     # Get list of available ODBC drivers
-    available_drivers = [driver for driver in pyodbc.drivers()]
+    available_drivers = installed_odbc_drivers()
     
     # If the requested driver is in the available drivers, return it
     if requested_driver in available_drivers:
@@ -24,16 +31,110 @@ def get_odbc_driver(driver_env_variable: str) -> str:
 # API Key
 SECRET_KEY = "customer_satisfaction"
 
+# Tokens
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", "3600"))                 # seconds an access token is valid
+REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", str(30 * 24 * 3600)))  # seconds a refresh token is valid
+REFRESH_SECRET_KEY = os.getenv("REFRESH_SECRET_KEY", "")                      # signs refresh tokens, empty = derived from SECRET_KEY
+REVOCATION_CACHE_TTL = float(os.getenv("REVOCATION_CACHE_TTL", "30"))        # seconds before the revocation list is reloaded
+
 # DB Connection for MASTER USER
-AUTH_DB_DRIVER = get_odbc_driver("AUTH_DB_DRIVER")
+# Drivers are resolved on first connection with get_odbc_driver("AUTH_DB_DRIVER") / ("INFO_DB_DRIVER")
 AUTH_DB_SERVER = os.getenv("AUTH_DB_SERVER", "PUT YOUR DB SERVER")
 AUTH_DB_NAME = os.getenv("AUTH_DB_NAME", "PUT YOUR NAME DB SERVER")
 AUTH_DB_USERNAME = os.getenv("AUTH_DB_USERNAME", "USERNAME")
 AUTH_DB_PASSWORD = os.getenv("AUTH_DB_PASSWORD", "P4SSW0RD")
 
 # DB Connection for STRUCTURE ORGANIZATION
-INFO_DB_DRIVER = get_odbc_driver("INFO_DB_DRIVER")
 INFO_DB_SERVER = os.getenv("INFO_DB_SERVER", "PUT YOUR DB SERVER")
 INFO_DB_NAME = os.getenv("INFO_DB_NAME", "PUT YOUR NAME DB SERVER")
 INFO_DB_USERNAME = os.getenv("INFO_DB_USERNAME", "USERNAME")
 INFO_DB_PASSWORD = os.getenv("INFO_DB_PASSWORD", "P@SSW0RD")
+
+# DB Connection Pool (applies to each database separately)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))                         # max open connections
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))                 # seconds to wait for a free connection
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))              # recycle connections idle longer than this
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))     # recycle connections older than this
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))           # run SELECT 1 on checkout after this idle time
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))              # seconds to wait for a login
+DB_QUERY_TIMEOUT = int(os.getenv("DB_QUERY_TIMEOUT", "30"))                 # seconds a statement may run, 0 = no limit
+
+# Circuit breaker per database, and stale data served while it is open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))   # failures in a row that open it, 0 = never
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))        # seconds open before a probe is let through
+STALE_CACHE_ROWS = int(os.getenv("STALE_CACHE_ROWS", "100000"))               # rows of last good read results kept, 0 = no fallback
+STALE_MAX_AGE = float(os.getenv("STALE_MAX_AGE", "86400"))                     # oldest result served as a fallback, 0 = any age
+
+# Warm-up before the worker serves its first request
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "True").lower() in ['true', '1', 't']
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "2"))     # connections opened per pool
+WARMUP_SNAPSHOT = os.getenv("WARMUP_SNAPSHOT", "True").lower() in ['true', '1', 't']   # load the org snapshot before serving
+
+# In-memory ORG STRUCTURE snapshot of HRIS_TrAD
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "True").lower() in ['true', '1', 't']
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "900"))   # seconds between reloads
+SNAPSHOT_MEMO_SIZE = int(os.getenv("SNAPSHOT_MEMO_SIZE", "256"))                   # cached responses per snapshot
+SNAPSHOT_HISTORY = int(os.getenv("SNAPSHOT_HISTORY", "50"))                       # versions kept for /structures/changes
+# Directory where one worker publishes the snapshot for the others to mmap; empty = every worker loads its own
+SNAPSHOT_SHARED_DIR = os.getenv("SNAPSHOT_SHARED_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshot"))
+SNAPSHOT_SHARED_POLL = float(os.getenv("SNAPSHOT_SHARED_POLL", "5"))               # seconds between checks for a newer shared snapshot
+
+# GET /export/snapshot bundles, written once per snapshot version
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "export"))
+EXPORT_KEEP = int(os.getenv("EXPORT_KEEP", "2"))                                   # snapshot versions whose exports are kept on disk
+
+# GET /users paging and streaming
+USERS_PAGE_MAX = int(os.getenv("USERS_PAGE_MAX", "5000"))            # largest ?limit= accepted
+USERS_STREAM_BATCH = int(os.getenv("USERS_STREAM_BATCH", "500"))     # rows per fetchmany when streaming
+
+# POST /users/batch
+BATCH_LOOKUP_MAX = int(os.getenv("BATCH_LOOKUP_MAX", "5000"))       # identifiers per request
+BATCH_QUERY_CHUNK = int(os.getenv("BATCH_QUERY_CHUNK", "1000"))     # ids per IN (...) query, SQL Server allows 2100 params
+
+# App processes on the host (the FastCGI maxInstances under IIS). Every worker
+# starts its own bcrypt pools and admits its own logins, so the bcrypt limits
+# below are PER WORKER; their defaults split one host's worth between workers.
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+
+# POST /register/bulk
+REGISTER_BULK_MAX = int(os.getenv("REGISTER_BULK_MAX", "1000"))       # users per request
+BCRYPT_PROCESSES = int(os.getenv("BCRYPT_PROCESSES", "0"))             # bcrypt processes per worker, 0 = CPUs / WORKER_PROCESSES
+
+# POST /login password checks, in their own bcrypt process pool
+BCRYPT_LOGIN_PROCESSES = int(os.getenv("BCRYPT_LOGIN_PROCESSES", "0"))   # processes per worker, 0 = CPUs / WORKER_PROCESSES
+BCRYPT_LOGIN_QUEUE = int(os.getenv("BCRYPT_LOGIN_QUEUE", str(max(1, 32 // WORKER_PROCESSES))))   # checks waiting per worker; more get 429
+
+# GET /users/search
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "20"))                 # results when ?limit= is omitted
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))                        # largest ?limit= accepted
+SEARCH_FUZZY_MIN_SIMILARITY = float(os.getenv("SEARCH_FUZZY_MIN_SIMILARITY", "0.5"))  # trigram similarity for typo matches
+
+# Response compression (gzip, or brotli when installed), negotiated from Accept-Encoding
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))               # bytes; smaller bodies are sent as-is
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+
+# Cache-Control sent with ETag'd GET responses. The default lets clients keep
+# a copy but makes them revalidate (If-None-Match -> 304) every time.
+CACHE_CONTROL = os.getenv("CACHE_CONTROL", "private, no-cache")
+
+# Threaded server (server.py)
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", "8"))                      # requests handled at once
+SERVER_CONNECTION_LIMIT = int(os.getenv("SERVER_CONNECTION_LIMIT", "200"))  # open client connections
+
+# GET /metrics needs a token like /pool/stats; a Prometheus job can send "Bearer <METRICS_TOKEN>" instead
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")   # empty = only access tokens from /login
+
+# Request timing
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))   # log requests slower than this
+
+# Logging (log/app.log, one JSON object per line, written off the request thread)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_ACCESS = os.getenv("LOG_ACCESS", "True").lower() in ['true', '1', 't']            # one INFO line per request
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))                 # rotate at 20 MB
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))                              # records waiting for the writer, extra are dropped
+LOG_ERROR_SAMPLE_BURST = int(os.getenv("LOG_ERROR_SAMPLE_BURST", "5"))                  # identical errors logged per window, 0 = no sampling
+LOG_ERROR_SAMPLE_WINDOW = float(os.getenv("LOG_ERROR_SAMPLE_WINDOW", "60"))            # seconds
@@ -0,0 +1,21 @@
+from waitress import serve
+from app import app
+from config import SERVER_HOST, SERVER_PORT, SERVER_THREADS, SERVER_CONNECTION_LIMIT, DB_POOL_SIZE
+
+# Alternative to IIS + wfastcgi: one process serving requests on a pool of
+# threads. pyodbc releases the GIL while SQL Server works, so requests
+# waiting on the database don't block each other.
+if __name__ == "__main__":
+    if SERVER_THREADS > DB_POOL_SIZE:
+        app.logger.warning(
+            f"SERVER_THREADS={SERVER_THREADS} is above DB_POOL_SIZE={DB_POOL_SIZE}, "
+            "requests will queue for database connections"
+        )
+    app.logger.info(f"Serving on {SERVER_HOST}:{SERVER_PORT} with {SERVER_THREADS} threads")
+    serve(
+        app,
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        threads=SERVER_THREADS,
+        connection_limit=SERVER_CONNECTION_LIMIT,
+    )